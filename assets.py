@@ -0,0 +1,227 @@
+"""
+Fingerprinted, precompressed static assets.
+
+``python assets.py`` copies every asset under ``static/`` (templates excluded)
+to ``static/dist/`` with a content hash in its name, writes ``.gz`` variants
+of the compressible ones (and ``.br`` when the optional ``brotli`` package is
+installed) and records the mapping in ``static/dist/manifest.json``. CSS
+``url()`` references are rewritten to the hashed names before the CSS itself
+is hashed, so a changed image also changes the stylesheets that use it.
+
+At runtime :func:`install` makes the templates' ``url_for('static', ...)``
+resolve to the hashed names, and :class:`PrecompressedStaticFiles` serves
+them with a year-long immutable Cache-Control, picking the ``.br`` or ``.gz``
+variant the client accepts. Without a build the manifest is empty and assets
+are served as they are.
+
+Usage::
+
+    python assets.py
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from jinja2 import pass_context
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = "static"
+DIST = "dist"
+MANIFEST = "manifest.json"
+# Jinja templates share static/ with the assets; templating lists them by these too.
+TEMPLATE_SUFFIXES = (".html", ".txt")
+COMPRESSIBLE_SUFFIXES = (".css", ".js", ".svg", ".ico", ".json", ".txt")
+# Variants that save less than this fraction of the original are not worth a lookup.
+MIN_SAVING = 0.1
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def fingerprint(path: str, content: bytes) -> str:
+    """
+    Insert a hash of ``content`` before the extension of ``path``.
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{hashlib.blake2b(content, digest_size=6).hexdigest()}{ext}"
+
+
+def _rewrite_css(path: str, content: bytes, manifest: dict) -> bytes:
+    directory = os.path.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        if ":" in url or url.startswith(("/", "#")):
+            return match.group(0)
+        target = os.path.normpath(os.path.join(directory, url)).replace(os.sep, "/")
+        if target not in manifest:
+            return match.group(0)
+        # The stylesheet itself moves to dist/ too.
+        hashed = os.path.relpath(manifest[target], os.path.join(DIST, directory)).replace(os.sep, "/")
+        return f"url({quote}{hashed}{quote})"
+
+    return _CSS_URL.sub(replace, content.decode("utf-8")).encode("utf-8")
+
+
+def _write_variants(path: str, content: bytes) -> list[str]:
+    if not path.endswith(COMPRESSIBLE_SUFFIXES):
+        return []
+    variants = [(".gz", gzip.compress(content, 9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(content)))
+    written = []
+    for suffix, compressed in variants:
+        if len(compressed) <= len(content) * (1 - MIN_SAVING):
+            with open(path + suffix, "wb") as file:
+                file.write(compressed)
+            written.append(suffix)
+    return written
+
+
+def build(static_dir: str = STATIC_DIR) -> dict:
+    """
+    Rebuild ``static_dir/dist`` and its manifest from the assets in ``static_dir``.
+
+    Returns:
+        dict: Asset path (relative to ``static_dir``) -> fingerprinted path.
+    """
+    dist = os.path.join(static_dir, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    assets = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for name in sorted(files):
+            if not name.endswith(TEMPLATE_SUFFIXES):
+                assets.append(os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/"))
+
+    manifest = {}
+    # Stylesheets go last so they can point at the hashed names of what they use.
+    for path in sorted(assets, key=lambda path: path.endswith(".css")):
+        with open(os.path.join(static_dir, path), "rb") as file:
+            content = file.read()
+        if path.endswith(".css"):
+            content = _rewrite_css(path, content, manifest)
+        hashed = f"{DIST}/{fingerprint(path, content)}"
+        target = os.path.join(static_dir, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as file:
+            file.write(content)
+        _write_variants(target, content)
+        manifest[path] = hashed
+
+    with open(os.path.join(dist, MANIFEST), "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir: str = STATIC_DIR) -> dict:
+    """
+    Read the manifest written by :func:`build`; empty if assets were not built.
+    """
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def install(templates, manifest: dict = None) -> str:
+    """
+    Make ``url_for('static', path=...)`` in ``templates`` return fingerprinted URLs.
+
+    Returns:
+        str: A version of the installed manifest; pages that embed asset URLs
+        include it in their validators.
+    """
+    manifest = load_manifest() if manifest is None else manifest
+    url_for = templates.env.globals["url_for"]
+
+    @pass_context
+    def fingerprinted_url_for(context, name, /, **path_params):
+        if name == "static" and path_params.get("path") in manifest:
+            path_params["path"] = manifest[path_params["path"]]
+        return url_for(context, name, **path_params)
+
+    templates.env.globals["url_for"] = fingerprinted_url_for
+    return hashlib.blake2b(json.dumps(manifest, sort_keys=True).encode(), digest_size=6).hexdigest()
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    """
+    Content codings an ``Accept-Encoding`` header allows (``q=0`` excluded).
+    """
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves fingerprinted assets as immutable, from their
+    ``.br``/``.gz`` variant when the client accepts one.
+
+    The files are sent with FileResponse, which hands the path to the server
+    (``http.response.pathsend``) where supported and streams it otherwise.
+    Anything outside ``dist/`` is served exactly like StaticFiles does.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dist = os.path.realpath(os.path.join(self.directory, DIST)) if self.directory else None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        if self.dist is None or os.path.commonpath([self.dist, os.path.realpath(full_path)]) != self.dist:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+        response = None
+        for encoding, suffix in ENCODINGS:
+            variant = f"{full_path}{suffix}"
+            if encoding in accepted and os.path.isfile(variant):
+                response = FileResponse(variant, status_code=status_code, media_type=media_type,
+                                        stat_result=os.stat(variant), headers={"Content-Encoding": encoding})
+                break
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, media_type=media_type,
+                                    stat_result=stat_result)
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.headers["Vary"] = "Accept-Encoding"
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress the static assets.")
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    manifest = build(parser.parse_args().static_dir)
+    print(f"{len(manifest)} assets fingerprinted{'' if brotli else ' (brotli not installed, gzip only)'}")
+
+
+if __name__ == "__main__":
+    main()
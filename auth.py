@@ -1,40 +1,77 @@
 import os
+import time
+from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Depends, Form
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 from starlette.requests import Request
 from starlette.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-import models, schemas
-from models import get_db
+import models, ratelimit, schemas
+from database import get_read_db, get_write_db, stick_to_primary
 from dotenv import load_dotenv
 from models import User
-
-templates = Jinja2Templates(directory="static")
+from cache import token_cache, user_cache
+from passwords import pwd_context, password_hasher
+from templating import templates
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 router = APIRouter()
 
 
-def optional_current_user(request: Request, db: Session = Depends(get_db)):
+def token_user_id(token: str) -> Optional[int]:
+    """
+    Return the user id carried in the ``sub`` claim of an access token.
+
+    Returns ``None`` if the token is invalid, expired or has no numeric subject.
+    The signature of a token is checked once; after that it is looked up in
+    the token cache, and only its expiry is checked.
+    """
+    cached = token_cache.get(token)
+    if cached is not None:
+        user_id, expires = cached
+        return user_id if expires > time.time() else None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        return None
+    if "exp" in payload:
+        token_cache.set(token, (user_id, payload["exp"]))
+    return user_id
+
+
+async def resolve_user(user_id: int, db: AsyncSession) -> Optional[schemas.UserOut]:
+    """
+    Resolve a user id to its principal, going to the database only on a cache miss.
+    """
+    async def load():
+        user = await db.get(User, user_id)
+        return schemas.UserOut.model_validate(user) if user else None
+
+    return await user_cache.get_or_load(user_id, load)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+async def optional_current_user(request: Request, db: AsyncSession = Depends(get_read_db)):
     token = request.cookies.get("access_token")
     if not token:
         return None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            return None
-        return db.query(User).filter(User.username == username).first()
-    except JWTError:
+    user_id = token_user_id(token)
+    if user_id is None:
         return None
+    return await resolve_user(user_id, db)
 
 
 def hash_password(password: str):
@@ -52,20 +89,16 @@ def create_token(data: dict, expires_delta: timedelta = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> models.User:
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_read_db)) -> schemas.UserOut:
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(status_code=401, detail="Not authorized")
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except JWTError:
+    user_id = token_user_id(token)
+    if user_id is None:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = await resolve_user(user_id, db)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -78,24 +111,35 @@ def register_page(request: Request):
 
 
 @router.post("/register", response_model=schemas.UserOut)
-def register(request: Request,
-             username: str = Form(),
-             password: str = Form(),
-             db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.username == username).first()
-    if existing_user:
+async def register(request: Request,
+                   username: str = Form(),
+                   password: str = Form(),
+                   db: AsyncSession = Depends(get_write_db)):
+    def taken():
         return templates.TemplateResponse("register.html", {"request": request, "error": "Username already taken"})
 
-    hashed = pwd_context.hash(password)
+    existing_user = await db.scalar(select(models.User).where(models.User.username == username))
+    if existing_user:
+        return taken()
+    # Give the write connection back while the password hashes.
+    await db.rollback()
+
+    hashed = await password_hasher.hash(password)
     new_user = models.User(username=username, password=hashed)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    token = create_token({"sub": username})
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Someone registered the name since the check; the unique index caught it.
+        await db.rollback()
+        return taken()
+    await db.refresh(new_user)
+
+    token = create_token({"sub": str(new_user.id)})
     response = RedirectResponse(url='/', status_code=302)
     response.set_cookie("access_token", token)
-    return response
+    # The new account may not have reached the replicas yet.
+    return stick_to_primary(response)
 
 
 @router.get("/login", response_class=HTMLResponse)
@@ -103,16 +147,28 @@ def login_form(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 
-@router.post("/login", response_model=schemas.Token)
-def login(request: Request,
-          username: str = Form(),
-          password: str = Form(),
-          db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == username).first()
-    if not db_user or not pwd_context.verify(password, db_user.password):
+@router.post("/login", response_model=schemas.Token, dependencies=[ratelimit.rate_limit("login")])
+async def login(request: Request,
+                username: str = Form(),
+                password: str = Form(),
+                db: AsyncSession = Depends(get_read_db)):
+    db_user = await db.scalar(select(models.User).where(models.User.username == username))
+    if not db_user or not await password_hasher.verify(password, db_user.password):
         return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid credentials"})
 
-    token = create_token(data={"sub": db_user.username})
+    token = create_token(data={"sub": str(db_user.id)})
     response = RedirectResponse(url='/', status_code=302)
     response.set_cookie("access_token", token)
     return response
+
+
+@router.get("/stats/hashing")
+def get_hashing_stats():
+    """
+    Report the password hashing pool counters.
+
+    Returns:
+        dict: Pool size, queue limit, in-flight/queued/rejected calls and the
+        hash latency and queue wait (count, average and maximum, in seconds).
+    """
+    return password_hasher.stats()
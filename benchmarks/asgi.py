@@ -0,0 +1,108 @@
+import asyncio
+import math
+import time
+from collections import Counter
+from functools import partial
+
+
+async def call(app, method: str, url: str, headers: dict = None, body: bytes = b"", on_body=None):
+    """
+    Send one HTTP request straight into an ASGI app, without a server.
+
+    If ``on_body`` is given it receives each body chunk as it is sent, and the
+    body is not collected.
+
+    Returns:
+        tuple[int, list, bytes]: Status code, raw response headers and body.
+    """
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    request_sent = False
+    response = {"status": None, "headers": [], "body": []}
+
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            await asyncio.Event().wait()
+        request_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            if on_body is None:
+                response["body"].append(message.get("body", b""))
+            else:
+                on_body(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], b"".join(response["body"])
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = min(max(math.ceil(fraction * len(sorted_values)), 1), len(sorted_values))
+    return sorted_values[rank - 1]
+
+
+async def load(app, make_request, total: int, concurrency: int, send=None) -> dict:
+    """
+    Fire ``total`` requests at ``app`` from ``concurrency`` concurrent clients.
+
+    ``make_request(i)`` returns the ``(method, url, headers, body)`` of the
+    i-th request. 4xx/5xx responses and exceptions raised by the app
+    are counted as errors. ``send`` replaces the in-process :func:`call`,
+    e.g. with a client talking to a real server; it takes the same
+    arguments without the app.
+
+    Returns:
+        dict: Request count, errors, responses per status code, wall time,
+        requests per second and p50/p95/p99 latency in milliseconds.
+    """
+    send = send or partial(call, app)
+    counter = iter(range(total))
+    statuses = Counter()
+    latencies = []
+
+    async def client():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                status, _, _ = await send(*make_request(i))
+            except Exception:
+                status = 500
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "statuses": dict(sorted(statuses.items())),
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        **{f"p{q}_ms": round(percentile(latencies, q / 100) * 1000, 2) for q in (50, 95, 99)},
+    }
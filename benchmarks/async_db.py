@@ -0,0 +1,140 @@
+"""
+Compare requests/sec of the async database path against the old sync one.
+
+The sync app below reproduces the handlers as they were before the port:
+``get_event`` as a plain ``def`` run in the thread pool and ``buy_ticket`` as
+an ``async def`` making blocking ``Session`` calls on the event loop. The
+async side is the real application with its session dependencies pointed at
+the same scratch database. The script exits with status 1 if any request on
+either side is not answered with a 2xx or 3xx.
+
+Usage::
+
+    python -m benchmarks.async_db --events 1000 --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import RedirectResponse
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+import auth
+import models
+from cache import event_cache
+from main import app as async_app
+from benchmarks.asgi import load
+from benchmarks.scratch import scratch_database, use_database
+
+
+def build_sync_app(session_factory):
+    app = FastAPI()
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def get_current_user(request: Request, db: Session = Depends(get_db)):
+        token = request.cookies.get("access_token")
+        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+        return db.query(models.User).filter(models.User.username == payload.get("sub")).first()
+
+    @app.get("/events/{event_id}")
+    def get_event(event_id: int, db: Session = Depends(get_db)):
+        event = db.get(models.Event, event_id)
+        if not event:
+            raise HTTPException(404, detail="Event not found")
+        return {"id": event.id, "name": event.name, "description": event.description}
+
+    @app.post("/tickets")
+    async def buy_ticket(request: Request, db: Session = Depends(get_db),
+                         current_user: models.User = Depends(get_current_user)):
+        form = await request.form()
+        new_ticket = models.Ticket(user_id=current_user.id, event_id=int(form.get("event_id")))
+        db.add(new_ticket)
+        db.commit()
+        db.refresh(new_ticket)
+        return RedirectResponse(url="/my-events", status_code=303)
+
+    return app
+
+
+def seed(path, events):
+    engine = create_engine(f"sqlite:///{path}")
+    with Session(engine) as db:
+        user = models.User(username="bench", password="x")
+        db.add(user)
+        db.add_all(models.Event(name=f"Event {i}", description="benchmark") for i in range(events))
+        db.commit()
+        user_id = user.id
+    engine.dispose()
+    return user_id
+
+
+async def run(args):
+    path = scratch_database()
+    user_id = seed(path, args.events)
+
+    sync_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    sync_app = build_sync_app(sessionmaker(bind=sync_engine, autoflush=False))
+
+    async_engines = use_database(async_app, path)
+    # Measure the database path, not the read-through cache in front of it.
+    event_cache.maxsize = 0
+
+    # The old handlers identify users by username, the current ones by id.
+    subjects = {"sync": "bench", "async": str(user_id)}
+    apps = {"sync": sync_app, "async": async_app}
+
+    def scenarios(subject):
+        form = {
+            "cookie": f"access_token={auth.create_token({'sub': subject})}",
+            "content-type": "application/x-www-form-urlencoded",
+        }
+        return {
+            "get_event": lambda i: ("GET", f"/events/{i % args.events + 1}", {}, b""),
+            "buy_ticket": lambda i: ("POST", "/tickets", form, f"event_id={i % args.events + 1}".encode()),
+        }
+
+    results = {}
+    for name in scenarios("").keys():
+        results[name] = {
+            mode: await load(app, scenarios(subjects[mode])[name], args.requests, args.concurrency)
+            for mode, app in apps.items()
+        }
+        results[name]["speedup"] = round(results[name]["async"]["rps"] / results[name]["sync"]["rps"], 2)
+
+    for async_engine in async_engines:
+        await async_engine.dispose()
+    sync_engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    results = asyncio.run(run(parser.parse_args()))
+    # A comparison is only meaningful if both sides answered every request.
+    failed = sum(n for result in results.values() for mode in ("sync", "async")
+                 for status, n in result[mode]["statuses"].items() if status >= 400)
+    print(json.dumps(results, indent=2))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare favorite toggling with and without the write-behind queue.
+
+Each mode gets a fresh copy of the same dataset and the same stream of add and
+remove clicks, many of them repeated. Afterwards every event's ``favorites``
+counter must equal its number of favorite rows; the script exits with status 1
+if it does not. Errors are reported but do not fail the run: with many
+concurrent writers the direct mode can exceed SQLite's busy timeout.
+
+Usage::
+
+    python -m benchmarks.favorites --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+import auth
+import favorites
+import models
+from main import app, password_hasher
+from benchmarks.asgi import load
+from benchmarks.scratch import scratch_database, use_database
+from benchmarks.suite import rebuild_stats, seed
+
+FORM = "application/x-www-form-urlencoded"
+
+
+def counters_match(path) -> bool:
+    engine = create_engine(f"sqlite:///{path}")
+    with Session(engine) as db:
+        rows = dict(db.execute(select(models.favourites_table.c.event_id, func.count())
+                               .group_by(models.favourites_table.c.event_id)).all())
+        counted = dict(db.execute(select(models.EventStats.event_id, models.EventStats.favorites)).all())
+    engine.dispose()
+    return all(counted.get(event_id, 0) == count for event_id, count in rows.items()) and \
+        all(count == rows.get(event_id, 0) for event_id, count in counted.items())
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    path = scratch_database()
+    user_ids, event_ids = seed(path, args.users, args.events, 0, args.users, 0, rng)
+    await rebuild_stats(path)
+    cookies = [f"access_token={auth.create_token({'sub': str(user_id)})}" for user_id in user_ids]
+    # A small pool of (user, event) pairs, so clicks repeat and collide.
+    clicks = [(rng.randrange(len(cookies)), rng.choice(event_ids), rng.random() < 0.6)
+              for _ in range(args.requests)]
+
+    def make_request(i):
+        user, event_id, add = clicks[i]
+        headers = {"cookie": cookies[user], "content-type": FORM}
+        return "POST", "/add-to-favorites" if add else "/remove-from-favorites", headers, f"event_id={event_id}".encode()
+
+    results = {}
+    for mode, write_behind in (("direct", False), ("write_behind", True)):
+        copy = os.path.join(os.path.dirname(path), f"{mode}.db")
+        shutil.copyfile(path, copy)
+        engines = use_database(app, copy)
+        favorites.WRITE_BEHIND = write_behind
+        writer = favorites.writer = favorites.FavoritesWriter()
+        try:
+            results[mode] = await load(app, make_request, args.requests, args.concurrency)
+            await writer.close()
+        finally:
+            for engine in engines:
+                await engine.dispose()
+        results[mode]["writer"] = writer.stats()
+        results[mode]["counters_match"] = counters_match(copy)
+    results["ok"] = all(results[mode]["counters_match"] for mode in ("direct", "write_behind"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    try:
+        result = asyncio.run(run(parser.parse_args()))
+    finally:
+        password_hasher.shutdown()
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Measure homepage requests/sec with and without the event card fragment cache.
+
+Both runs render the same page of events for a logged-in user against the
+same scratch database; the uncached run sets the cache's byte budget to zero
+so every request renders the cards.
+
+Usage::
+
+    python -m benchmarks.fragments --events 100 --requests 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import os
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+import auth
+from cache import fragment_cache
+from main import app
+from benchmarks.asgi import load
+from benchmarks.query_counts import seed
+from benchmarks.scratch import scratch_database, use_database
+
+
+async def run(args):
+    path = scratch_database()
+    user_id = seed(path, args.events)
+    engines = use_database(app, path)
+    headers = {"cookie": f"access_token={auth.create_token({'sub': str(user_id)})}"}
+    url = f"/?limit={args.events}"
+
+    results = {}
+    for mode, max_bytes in (("uncached", 0), ("cached", fragment_cache.max_bytes)):
+        fragment_cache.max_bytes = max_bytes
+        fragment_cache.clear()
+        results[mode] = await load(app, lambda i: ("GET", url, headers, b""), args.requests, args.concurrency)
+        results[mode]["fragments"] = fragment_cache.stats()
+    results["speedup"] = round(results["cached"]["rps"] / results["uncached"]["rps"], 2)
+
+    for engine in engines:
+        await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Measure the job queue behind ticket purchases and check its guarantees.
+
+On a seeded scratch database the script:
+
+* buys tickets through the app with and without the ``ticket_purchased`` job
+  being queued, to show what queueing adds to a purchase, and runs the
+  receipt handler inline for comparison;
+* drains the queue with a :class:`jobs.Worker` and checks that every
+  purchase got exactly one job and that all of them completed;
+* runs jobs that fail a few times and jobs that always fail, and checks that
+  the first complete after retries and the second end up dead;
+* claims jobs with a short lease and abandons them, as a crashed worker
+  would, and checks that another worker takes them over.
+
+It exits with status 1 if a check fails.
+
+Usage::
+
+    python -m benchmarks.jobs --requests 1000 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import auth
+import database
+import jobs
+import models
+from main import app, password_hasher
+from benchmarks.asgi import load
+from benchmarks.scratch import scratch_database, use_database
+from benchmarks.suite import FORM, rebuild_stats, seed
+
+
+def count(path, *where) -> int:
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.connect() as conn:
+        value = conn.scalar(select(func.count()).select_from(models.Job).where(*where))
+    engine.dispose()
+    return value
+
+
+async def buy(path, make_request, args, enqueue=True) -> dict:
+    engines = use_database(app, path)
+    original = jobs.enqueue
+    if not enqueue:
+        jobs.enqueue = lambda *args, **kwargs: None
+    try:
+        return await load(app, make_request, args.requests, args.concurrency)
+    finally:
+        jobs.enqueue = original
+        for engine in engines:
+            await engine.dispose()
+
+
+async def drain(sessions, concurrency: int) -> jobs.Worker:
+    """
+    Run a worker until nothing is queued, waiting out retry backoffs.
+    """
+    worker = jobs.Worker(sessions, concurrency=concurrency, poll_seconds=0.01)
+    while True:
+        await worker.run(burst=True)
+        async with sessions() as db:
+            if not await db.scalar(select(func.count()).select_from(models.Job).where(
+                    models.Job.status != models.JobStatus.dead)):
+                return worker
+        await asyncio.sleep(0.01)
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    path = scratch_database()
+    user_ids, event_ids = seed(path, args.users, args.events, 0, 0, 0, rng)
+    await rebuild_stats(path)
+    cookies = [f"access_token={auth.create_token({'sub': str(user_id)})}" for user_id in user_ids]
+
+    def make_request(i):
+        headers = {"cookie": cookies[i % len(cookies)], "content-type": FORM}
+        return "POST", "/tickets", headers, f"event_id={event_ids[i * 7 % len(event_ids)]}".encode()
+
+    results = {}
+    baseline = os.path.join(os.path.dirname(path), "without_queue.db")
+    shutil.copyfile(path, baseline)
+    results["purchase_without_queue"] = await buy(baseline, make_request, args, enqueue=False)
+    results["purchase_with_queue"] = await buy(path, make_request, args)
+    purchases = results["purchase_with_queue"]["statuses"].get(303, 0)
+    queued = count(path)
+
+    engine = database.make_async_engine(f"sqlite:///{path}")
+    sessions = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    try:
+        # What each purchase would wait for if the receipt were sent inline.
+        async with sessions() as db:
+            ticket_ids = (await db.scalars(select(models.Ticket.id).limit(args.inline_samples))).all()
+        started = time.perf_counter()
+        for ticket_id in ticket_ids:
+            async with sessions() as db:
+                await jobs.send_receipt(db, {"ticket_id": ticket_id})
+        results["receipt_inline_ms"] = round((time.perf_counter() - started) / len(ticket_ids) * 1000, 2)
+
+        started = time.perf_counter()
+        worker = await drain(sessions, args.worker_concurrency)
+        elapsed = time.perf_counter() - started
+        results["drain"] = {"jobs": queued, "seconds": round(elapsed, 3), "jobs_per_second": round(queued / elapsed, 1),
+                            **worker.stats()}
+        sync_engine = create_engine(f"sqlite:///{path}")
+        results["queue_after_drain"] = jobs.queue_stats(sync_engine)
+        sync_engine.dispose()
+
+        # Retries and dead-lettering.
+        failures = {}
+
+        @jobs.handler("flaky")
+        async def flaky(db, payload):
+            failures[payload["n"]] = failures.get(payload["n"], 0) + 1
+            if failures[payload["n"]] < 3:
+                raise RuntimeError("temporary failure")
+
+        @jobs.handler("broken")
+        async def broken(db, payload):
+            raise RuntimeError("permanent failure")
+
+        async with sessions() as db:
+            for n in range(args.failing_jobs):
+                jobs.enqueue(db, "flaky", {"n": n}, max_attempts=4)
+                jobs.enqueue(db, "broken", {"n": n}, max_attempts=3)
+            jobs.enqueue(db, "unknown", {})
+            await db.commit()
+        worker = await drain(sessions, args.worker_concurrency)
+        async with sessions() as db:
+            dead = dict((await db.execute(
+                select(models.Job.kind, func.count()).where(models.Job.status == models.JobStatus.dead)
+                .group_by(models.Job.kind))).all())
+        results["failures"] = {**worker.stats(), "dead_by_kind": dead}
+
+        # A worker that claimed jobs and died: its lease runs out, another takes over.
+        async with sessions() as db:
+            for ticket_id in ticket_ids[:args.failing_jobs]:
+                jobs.enqueue(db, "ticket_purchased", {"ticket_id": ticket_id})
+            await db.commit()
+        async with sessions() as db:
+            abandoned = await jobs.claim(db, args.failing_jobs, lease_seconds=0.2)
+        await asyncio.sleep(0.3)
+        worker = await drain(sessions, args.worker_concurrency)
+        results["lease_takeover"] = {"abandoned": len(abandoned), **worker.stats()}
+    finally:
+        await engine.dispose()
+
+    results["ok"] = (
+        queued == purchases
+        and results["drain"]["completed"] == queued
+        and results["queue_after_drain"]["queued"] == results["queue_after_drain"]["running"] == 0
+        and all(failures[n] == 3 for n in range(args.failing_jobs))
+        and dead == {"broken": args.failing_jobs, "unknown": 1}
+        and results["failures"]["completed"] == args.failing_jobs
+        and results["lease_takeover"]["completed"] == len(abandoned) == args.failing_jobs
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--worker-concurrency", type=int, default=jobs.CONCURRENCY)
+    parser.add_argument("--failing-jobs", type=int, default=20)
+    parser.add_argument("--inline-samples", type=int, default=200)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    # Retries are expected here; do not wait seconds between them or log each one.
+    jobs.RETRY_BASE_SECONDS = 0.01
+    jobs.log.setLevel(logging.CRITICAL)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        password_hasher.shutdown()
+    print(json.dumps(results, indent=2))
+    if not results["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Hold many idle live streams open and check what they receive.
+
+A uvicorn server is started on a seeded scratch database and ``--streams``
+server-sent event connections are opened: half follow one of the ``--hot``
+busiest events through ``/events/{id}/live``, half follow several events
+through the multiplexed ``/events/live``. Tickets, favorites and feedbacks
+are then written to the hot events over HTTP.
+
+Afterwards every stream must have received, per event it follows, deltas
+adding up to the change in ``tickets_sold``, the favorite counter and the
+feedback count in the database; the script exits with status 1 if one did
+not. It reports the server's memory per open stream, the CPU time it spent
+while the writes ran, the messages each stream received against the writes
+made, and how long the streams took to catch up after the last write.
+
+Usage::
+
+    python -m benchmarks.live --streams 5000 --writes 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from urllib.parse import urlencode
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+import auth
+from passwords import password_hasher
+from benchmarks.scratch import scratch_database
+from benchmarks.suite import FORM, HTTPClient, free_port, rebuild_stats, seed, start_server
+from benchmarks.asgi import load
+
+CONNECT_BATCH = 500
+
+
+class Stream:
+    """
+    One SSE connection, summing the changes it receives per event.
+    """
+
+    def __init__(self, event_ids):
+        self.event_ids = event_ids
+        self.totals = {event_id: {"tickets_sold": 0, "favorites": 0, "feedbacks": 0} for event_id in event_ids}
+        self.messages = 0
+        self.last_message = 0.0
+        self.task = None
+
+    @property
+    def url(self):
+        if len(self.event_ids) == 1:
+            return f"/events/{self.event_ids[0]}/live"
+        return "/events/live?" + urlencode([("id", event_id) for event_id in self.event_ids])
+
+    async def open(self, port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {self.url} HTTP/1.1\r\nhost: 127.0.0.1\r\naccept: text/event-stream\r\n\r\n".encode())
+        head = await reader.readuntil(b"\r\n\r\n")
+        if not head.startswith(b"HTTP/1.1 200"):
+            raise RuntimeError(f"{self.url} answered {head.splitlines()[0].decode()}")
+        self.writer = writer
+        self.task = asyncio.create_task(self.read(reader))
+
+    async def read(self, reader):
+        buffer = b""
+        # The body is chunked; a chunk holds whole SSE messages, but splitting on
+        # blank lines does not rely on that.
+        while size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16):
+            buffer += (await reader.readexactly(size + 2))[:-2]
+            *frames, buffer = buffer.split(b"\n\n")
+            for frame in frames:
+                data = [line[6:] for line in frame.split(b"\n") if line.startswith(b"data: ")]
+                if data:
+                    self.receive(json.loads(b"\n".join(data)))
+
+    def receive(self, change):
+        self.messages += 1
+        self.last_message = time.perf_counter()
+        totals = self.totals[change["event_id"]]
+        totals["tickets_sold"] += change.get("tickets_sold", 0)
+        totals["favorites"] += change.get("favorites", 0)
+        totals["feedbacks"] += len(change.get("feedbacks", ())) + change.get("more_feedbacks", 0)
+
+    async def close(self):
+        self.task.cancel()
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def snapshot(path, event_ids) -> dict:
+    conn = sqlite3.connect(path)
+    try:
+        totals = {}
+        for event_id in event_ids:
+            totals[event_id] = {
+                "tickets_sold": conn.execute("SELECT tickets_sold FROM events WHERE id = ?", (event_id,)).fetchone()[0],
+                "favorites": (conn.execute("SELECT favorites FROM event_stats WHERE event_id = ?", (event_id,))
+                              .fetchone() or (0,))[0],
+                "feedbacks": conn.execute("SELECT count(*) FROM feedbacks WHERE event_id = ?",
+                                          (event_id,)).fetchone()[0],
+            }
+        return totals
+    finally:
+        conn.close()
+
+
+def cpu_seconds(pid) -> float:
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def rss_kb(pid) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        return next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+
+
+def writes(user_ids, hot):
+    """
+    Request factory mixing ticket purchases, favorite toggles and feedbacks on the hot events.
+    """
+    cookies = [f"access_token={auth.create_token({'sub': str(user_id)})}" for user_id in user_ids]
+
+    def make_request(i):
+        kind = i % 4
+        # Every other remove undoes the add just before it, so the counter moves both ways.
+        j = i - 1 if kind == 2 and i // 4 % 2 else i
+        event_id = hot[j % len(hot)]
+        user_id = user_ids[j * 7 % len(user_ids)]
+        cookie = cookies[j * 7 % len(cookies)]
+        if kind == 0:
+            return "POST", "/tickets", {"cookie": cookie, "content-type": FORM}, f"event_id={event_id}".encode()
+        if kind == 3:
+            body = json.dumps({"event_id": event_id, "user_id": user_id, "rating": 1 + i % 5,
+                               "comment": f"Live feedback {i}"}).encode()
+            return "POST", "/feedbacks", {"content-type": "application/json"}, body
+        url = "/add-to-favorites" if kind == 1 else "/remove-from-favorites"
+        return "POST", url, {"cookie": cookie, "content-type": FORM}, f"event_id={event_id}".encode()
+
+    return make_request
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    path = scratch_database()
+    user_ids, event_ids = seed(path, args.users, args.events, 0, 0, 0, rng)
+    await rebuild_stats(path)
+    hot = event_ids[:args.hot]
+    streams = [Stream([hot[i % len(hot)]]) if i % 2 == 0 else
+               Stream(sorted({hot[i % len(hot)], *rng.sample(event_ids, args.follow - 1)}))
+               for i in range(args.streams)]
+
+    port = free_port()
+    server = start_server(path, port)
+    client = HTTPClient("127.0.0.1", port)
+    try:
+        await client.call("GET", f"/events/{hot[0]}")
+        idle_rss = rss_kb(server.pid)
+        for start in range(0, len(streams), CONNECT_BATCH):
+            await asyncio.gather(*(stream.open(port) for stream in streams[start:start + CONNECT_BATCH]))
+        await asyncio.sleep(1)
+        streams_rss = rss_kb(server.pid)
+
+        before = snapshot(path, event_ids)
+        cpu = cpu_seconds(server.pid)
+        result = await load(None, writes(user_ids, hot), args.writes, args.concurrency, send=client.call)
+        written = time.perf_counter()
+        after = snapshot(path, event_ids)
+        expected = {event_id: {name: after[event_id][name] - before[event_id][name] for name in after[event_id]}
+                    for event_id in event_ids}
+
+        def caught_up():
+            return all(stream.totals[event_id] == expected[event_id]
+                       for stream in streams for event_id in stream.event_ids)
+
+        deadline = time.perf_counter() + args.timeout
+        while not caught_up() and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        ok = caught_up()
+        cpu = cpu_seconds(server.pid) - cpu
+        metrics = (await client.call("GET", "/metrics"))[2].decode()
+    finally:
+        # uvicorn only exits once every response has ended.
+        await asyncio.gather(*(stream.close() for stream in streams if stream.task), return_exceptions=True)
+        client.close()
+        server.terminate()
+        server.wait()
+
+    lag = max((stream.last_message for stream in streams), default=written) - written
+    return {
+        "ok": ok,
+        "streams": len(streams),
+        "writes": result,
+        "changes_on_hot_events": {event_id: expected[event_id] for event_id in hot},
+        "server_rss_kb": {"idle": idle_rss, "with_streams": streams_rss,
+                          "per_stream": round((streams_rss - idle_rss) / len(streams), 2)},
+        "messages_per_stream": round(sum(stream.messages for stream in streams) / len(streams), 1),
+        "catch_up_ms": round(max(lag, 0) * 1000, 1),
+        "server_cpu_seconds": round(cpu, 2),
+        "broker": {line.split()[0].removeprefix("eventplanner_live_"): int(float(line.split()[1]))
+                   for line in metrics.splitlines() if line.startswith("eventplanner_live_")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--streams", type=int, default=5000)
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--hot", type=int, default=5, help="events receiving the writes")
+    parser.add_argument("--follow", type=int, default=10, help="events per multiplexed stream")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for the streams to catch up")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        password_hasher.shutdown()
+    print(json.dumps(results, indent=2))
+    if not results["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Check that the HTML pages render in a constant number of queries.
+
+Each page is rendered against a small and a large dataset. The number of SQL
+statements must not grow with the number of events, sponsors or favorites,
+and must stay within the budget below; the script exits with status 1 on the
+first page that regresses into an N+1 pattern.
+
+Usage::
+
+    python -m benchmarks.query_counts
+"""
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import auth
+import models
+from cache import user_cache
+from main import app
+from benchmarks.asgi import call
+from benchmarks.scratch import scratch_database, use_database
+from benchmarks.sql_counter import assert_max_queries
+
+# page -> statements allowed with a cold user cache
+BUDGETS = {
+    "/?limit=100": 3,
+    "/my-events": 2,
+}
+
+
+def seed(path, events):
+    engine = create_engine(f"sqlite:///{path}")
+    with Session(engine) as db:
+        user = models.User(username="reader", password="x")
+        db.add(user)
+        start = datetime(2030, 1, 1)
+        for i in range(events):
+            event = models.Event(name=f"Event {i}", description="d", place="A", price=10.0,
+                                 date=start + timedelta(days=i))
+            event.sponsors = [models.Sponsor(firm_name=f"Sponsor {i}.{j}") for j in range(3)]
+            user.favorites.append(event)
+            db.add(event)
+        db.commit()
+        user_id = user.id
+    engine.dispose()
+    return user_id
+
+
+async def measure(events):
+    path = scratch_database()
+    user_id = seed(path, events)
+    engines = use_database(app, path)
+    headers = {"cookie": f"access_token={auth.create_token({'sub': str(user_id)})}"}
+    counts = {}
+    try:
+        for page, budget in BUDGETS.items():
+            user_cache.clear()
+            with assert_max_queries(engines, budget) as queries:
+                status, _, _ = await call(app, "GET", page, headers)
+            assert status == 200, f"{page} returned {status}"
+            counts[page] = queries.count
+    finally:
+        for engine in engines:
+            await engine.dispose()
+    return counts
+
+
+def main():
+    try:
+        small = asyncio.run(measure(2))
+        large = asyncio.run(measure(60))
+        assert small == large, f"query count grows with data: {small} -> {large}"
+    except AssertionError as exc:
+        print(f"FAIL: {exc}")
+        sys.exit(1)
+    print(f"OK: {large}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Check that no hot query falls back to a full table scan.
+
+The main pages and API calls are requested against a migrated, seeded scratch
+database while every statement they run is captured with its parameters.
+Each captured query is then run through SQLite's ``EXPLAIN QUERY PLAN``; a
+plan step that scans a whole table (``SCAN <table>`` without an index), or
+that scans the paginated events table while filtering it (even ``USING
+INDEX``: a page must seek to its cursor, not walk the index up to it) fails
+the check, and the script exits with status 1 listing the offending queries.
+Only an unfiltered first page may read the events index from its start.
+
+Usage::
+
+    python -m benchmarks.query_plans
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from sqlalchemy import event
+
+import auth
+import pagination
+from cache import event_cache, user_cache
+from main import app, password_hasher
+from benchmarks.asgi import call
+from benchmarks.scratch import scratch_database, use_database
+from benchmarks.suite import FORM, PASSWORD, rebuild_stats, seed
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+# Tables read a page at a time, which must be sought into rather than scanned through.
+PAGINATED_SCAN = re.compile(r"^SCAN events\b")
+FILTERED = re.compile(r"\bWHERE\b")
+# Undated events sort first: a cursor among them seeks both the undated and the dated ones.
+UNDATED_CURSOR = pagination.pack_cursor(None, 0)
+
+
+def requests(user_id, event_id, cursor):
+    cookie = {"cookie": f"access_token={auth.create_token({'sub': str(user_id)})}"}
+    form = {**cookie, "content-type": FORM}
+    return [
+        ("GET", "/?limit=20", cookie, b""),
+        ("GET", "/my-events", cookie, b""),
+        ("GET", "/events?limit=20", cookie, b""),
+        ("GET", "/events?limit=20&place=Hall+1", cookie, b""),
+        ("GET", f"/events?limit=20&cursor={cursor}", cookie, b""),
+        ("GET", f"/events?limit=20&place=Hall+1&cursor={cursor}", cookie, b""),
+        ("GET", f"/events?limit=20&cursor={UNDATED_CURSOR}", cookie, b""),
+        ("GET", f"/?limit=20&cursor={cursor}", cookie, b""),
+        ("GET", "/events/search?q=synthetic", {}, b""),
+        ("GET", f"/events/{event_id}", {}, b""),
+        ("GET", f"/events/{event_id}/stats", {}, b""),
+        *(("GET", f"/events/{event_id}/{kind}", {}, b"") for kind in ("tickets", "feedbacks", "sponsors", "speakers")),
+        ("GET", f"/events/{event_id}/tickets?stream=ndjson", {}, b""),
+        ("POST", "/login", {"content-type": FORM}, f"username=user0&password={PASSWORD}".encode()),
+        ("POST", "/tickets", form, f"event_id={event_id}".encode()),
+        ("POST", "/add-to-favorites", form, f"event_id={event_id}".encode()),
+        ("POST", "/remove-from-favorites", form, f"event_id={event_id}".encode()),
+    ]
+
+
+async def capture(engines, user_id, event_id):
+    """
+    Run the requests and return ``(request, statement, parameters)`` of every query.
+    """
+    cookie = {"cookie": f"access_token={auth.create_token({'sub': str(user_id)})}"}
+    status, _, body = await call(app, "GET", "/events?limit=20", cookie)
+    if status != 200:
+        raise RuntimeError(f"GET /events?limit=20 answered {status}")
+    cursor = json.loads(body)["next_cursor"]
+    captured = []
+    label = None
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            captured.append((label, statement, parameters))
+
+    sync_engines = [engine.sync_engine for engine in engines]
+    for engine in sync_engines:
+        event.listen(engine, "before_cursor_execute", record)
+    try:
+        for method, url, headers, body in requests(user_id, event_id, cursor):
+            label = f"{method} {url}"
+            event_cache.clear()
+            user_cache.clear()
+            status, _, _ = await call(app, method, url, headers, body)
+            if status >= 400:
+                raise RuntimeError(f"{label} answered {status}")
+    finally:
+        for engine in sync_engines:
+            event.remove(engine, "before_cursor_execute", record)
+    return captured
+
+
+def full_scans(path, captured):
+    """
+    Return ``(request, statement, plan step)`` for every query plan step that
+    scans a table, or scans a paginated one it filters.
+    """
+    conn = sqlite3.connect(path)
+    failures = []
+    try:
+        # Scanning a subquery (bounded by its own LIMIT) reads no table.
+        tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for label, statement, parameters in captured:
+            if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+                continue
+            for _, _, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                full_scan = FULL_SCAN.match(detail)
+                if (full_scan and full_scan.group(1) in tables) or (
+                        PAGINATED_SCAN.match(detail) and FILTERED.search(statement)):
+                    failures.append((label, statement, detail))
+    finally:
+        conn.close()
+    return failures
+
+
+async def run():
+    path = scratch_database()
+    user_ids, event_ids = seed(path, 200, 500, 5000, 1000, 1000, random.Random(0))
+    await rebuild_stats(path)
+    engines = use_database(app, path)
+    try:
+        captured = await capture(engines, user_ids[0], event_ids[0])
+    finally:
+        for engine in engines:
+            await engine.dispose()
+    return captured, full_scans(path, captured)
+
+
+def main():
+    try:
+        captured, failures = asyncio.run(run())
+    finally:
+        password_hasher.shutdown()
+    for label, statement, detail in failures:
+        print(f"FULL SCAN in {label}: {detail}\n  {' '.join(statement.split())}")
+    if failures:
+        sys.exit(1)
+    print(f"OK: {len(captured)} queries from {len({label for label, _, _ in captured})} requests use indexes")
+
+
+if __name__ == "__main__":
+    main()
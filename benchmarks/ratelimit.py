@@ -0,0 +1,206 @@
+"""
+Measure what the rate limiter costs and what it protects.
+
+* The cost of one check: taking a token from the in-memory backend (from a
+  single bucket and spread over many clients, allowed and rejected),
+  resolving the client of a request, and the whole check the route
+  dependency runs. A request resolves its client once, on its first check,
+  so those are measured on a new request each time (less the cost of making
+  one) as well as repeated on the same request.
+* Whether a few abusive clients can slow everyone else down: well-behaved
+  users buy tickets through the app while a handful of users hammer the same
+  endpoint, once without limits and once with them. Without limits the
+  abusers' purchases queue up for the database with everyone else's; with
+  them they are turned away before a session is opened.
+
+The script exits with status 1 if taking a token from a client's bucket
+costs a microsecond or more, or if the limits turn away a well-behaved user.
+That budget covers the bucket only: the whole first check of a request,
+which parses its cookies and looks up its token, costs a few microseconds.
+
+Usage::
+
+    python -m benchmarks.ratelimit --requests 400 --abusers 3
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import timeit
+from collections import Counter
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from starlette.requests import Request
+
+import auth
+import ratelimit
+from main import app, password_hasher
+from benchmarks.asgi import call, load
+from benchmarks.scratch import scratch_database, use_database
+from benchmarks.suite import FORM, rebuild_stats, seed
+
+CHECK_BUDGET_NS = 1000
+
+
+def per_call_ns(function, number: int, baseline=lambda: None) -> float:
+    """
+    The best time of ``function`` over five runs, less that of ``baseline``
+    (what the harness itself costs), in nanoseconds per call.
+    """
+    def best(f):
+        return min(timeit.repeat(f, number=number, repeat=5)) / number
+    return round((best(function) - best(baseline)) * 1e9, 1)
+
+
+def check_costs(number: int) -> dict:
+    backend = ratelimit.MemoryBackend()
+    roomy = ratelimit.Limit("roomy", 10 ** 12, 1)
+    tight = ratelimit.Limit("tight", 1, 3600)
+    backend.consume(tight, "user:1")
+    keys = [f"user:{i}" for i in range(100_000)]
+    spread = itertools.cycle(keys)
+
+    token = auth.create_token({"sub": "1"})
+    cookie = [(b"cookie", f"access_token={token}".encode())]
+
+    def new_request(headers):
+        return Request({"type": "http", "headers": headers, "client": ("127.0.0.1", 50000)})
+
+    limiter = ratelimit.RateLimiter(ratelimit.MemoryBackend(), enabled=True)
+    loop = asyncio.new_event_loop()
+
+    async def checks(make_request, n):
+        for _ in range(n):
+            await limiter.check(roomy, make_request())
+
+    async def requests_only(make_request, n):
+        for _ in range(n):
+            make_request()
+
+    def check_ns(make_request):
+        return round(per_call_ns(lambda: loop.run_until_complete(checks(make_request, 1000)), number // 1000,
+                                 baseline=lambda: loop.run_until_complete(requests_only(make_request, 1000)))
+                     / 1000, 1)
+
+    anonymous, signed_in = new_request([]), new_request(cookie)
+    try:
+        return {
+            "consume_allowed_ns": per_call_ns(lambda: backend.consume(roomy, "user:1"), number),
+            "consume_rejected_ns": per_call_ns(lambda: backend.consume(tight, "user:1"), number),
+            "consume_100k_clients_ns": per_call_ns(lambda: backend.consume(roomy, next(spread)), number,
+                                                   baseline=lambda: next(spread)),
+            "client_key_first_anonymous_ns": per_call_ns(lambda: ratelimit.client_key(new_request([])), number,
+                                                         baseline=lambda: new_request([])),
+            "client_key_first_signed_in_ns": per_call_ns(lambda: ratelimit.client_key(new_request(cookie)), number,
+                                                         baseline=lambda: new_request(cookie)),
+            "client_key_again_ns": per_call_ns(lambda: ratelimit.client_key(signed_in), number),
+            "check_first_anonymous_ns": check_ns(lambda: new_request([])),
+            "check_first_signed_in_ns": check_ns(lambda: new_request(cookie)),
+            "check_again_ns": check_ns(lambda: anonymous),
+        }
+    finally:
+        loop.close()
+
+
+async def flood(make_request, rate: float, max_in_flight: int, stop: asyncio.Event) -> Counter:
+    """
+    Send requests at ``rate`` per second, whether or not earlier ones were
+    answered (up to ``max_in_flight`` unanswered), until ``stop`` is set.
+    """
+    statuses = Counter()
+    in_flight = set()
+
+    async def send(i):
+        try:
+            status, _, _ = await call(app, *make_request(i))
+        except Exception:
+            status = 500
+        statuses[status] += 1
+
+    for i in itertools.count():
+        if stop.is_set():
+            break
+        if len(in_flight) < max_in_flight:
+            task = asyncio.create_task(send(i))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        await asyncio.sleep(1 / rate)
+    await asyncio.gather(*in_flight)
+    return statuses
+
+
+async def contention(path, args, user_ids, event_ids, limited: bool) -> dict:
+    """
+    Well-behaved users buy tickets while the abusers flood the same endpoint.
+    """
+    ratelimit.limiter = ratelimit.RateLimiter(ratelimit.MemoryBackend(), enabled=limited)
+    cookies = [f"access_token={auth.create_token({'sub': str(user_id)})}" for user_id in user_ids]
+    abusers, users = cookies[:args.abusers], cookies[args.abusers:]
+
+    def purchase(cookie, i):
+        headers = {"cookie": cookie, "content-type": FORM}
+        return "POST", "/tickets", headers, f"event_id={event_ids[i * 7 % len(event_ids)]}".encode()
+
+    engines = use_database(app, path)
+    try:
+        stop = asyncio.Event()
+        abuse = asyncio.create_task(flood(lambda i: purchase(abusers[i % len(abusers)], i),
+                                          args.abuser_rate, args.abuser_concurrency, stop))
+        await asyncio.sleep(1)
+        result = await load(app, lambda i: purchase(users[i % len(users)], i), args.requests, args.concurrency)
+        stop.set()
+        abused = await abuse
+    finally:
+        for engine in engines:
+            await engine.dispose()
+    return {"users": result, "abusers": dict(sorted(abused.items()))}
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    results = {}
+    for limited in (False, True):
+        path = scratch_database()
+        user_ids, event_ids = seed(path, args.users + args.abusers, args.events, 0, 0, 0, rng)
+        await rebuild_stats(path)
+        started = time.perf_counter()
+        results["with_limits" if limited else "without_limits"] = await contention(
+            path, args, user_ids, event_ids, limited)
+        results["with_limits" if limited else "without_limits"]["seconds"] = round(time.perf_counter() - started, 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=400, help="purchases by well-behaved users")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--users", type=int, default=100, help="well-behaved users")
+    parser.add_argument("--abusers", type=int, default=3)
+    parser.add_argument("--abuser-rate", type=float, default=200, help="abusive requests per second, in all")
+    parser.add_argument("--abuser-concurrency", type=int, default=100, help="unanswered abusive requests at most")
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--checks", type=int, default=200_000, help="iterations per check cost measured")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    check = check_costs(args.checks)
+    try:
+        results = {"check": check, **asyncio.run(run(args))}
+    finally:
+        password_hasher.shutdown()
+    results["ok"] = (
+        max(check["consume_allowed_ns"], check["consume_rejected_ns"]) < CHECK_BUDGET_NS
+        and 429 not in results["with_limits"]["users"]["statuses"]
+    )
+    print(json.dumps(results, indent=2))
+    if not results["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import database
+import migrations
+
+
+def scratch_database() -> str:
+    """
+    Create an empty database with the full schema in a temporary directory.
+
+    Returns:
+        str: Path of the SQLite file.
+    """
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = database.make_engine(f"sqlite:///{path}")
+    migrations.upgrade(engine)
+    engine.dispose()
+    return path
+
+
+def use_database(app, path: str):
+    """
+    Point the app's read and write sessions at the SQLite file at ``path``.
+
+    Like the real configuration, reads use their own read-only pool.
+
+    Returns:
+        tuple[AsyncEngine, AsyncEngine]: The write and read engines behind the
+        overridden sessions; dispose them when the run is over.
+    """
+    engine = database.make_async_engine(f"sqlite:///{path}")
+    read_engine = database.make_read_engine(f"sqlite:///{path}")
+    write_sessions = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    read_sessions = async_sessionmaker(bind=read_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_write_db():
+        async with write_sessions() as db:
+            yield db
+
+    async def get_read_db():
+        async with read_sessions() as db:
+            yield db
+
+    app.dependency_overrides[database.get_write_db] = get_write_db
+    app.dependency_overrides[database.get_read_db] = get_read_db
+    app.dependency_overrides[database.get_read_sessions] = lambda: read_sessions
+    app.dependency_overrides[database.get_write_sessions] = lambda: write_sessions
+    return engine, read_engine
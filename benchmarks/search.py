@@ -0,0 +1,94 @@
+"""
+Measure full-text search latency at catalogue scale.
+
+A scratch database is seeded with ``--events`` events (a million by default)
+and searched one request at a time through the app, for the first page and
+for a page behind a cursor, with queries of three breadths:
+
+* ``broad``: a word every event matches;
+* ``place``: a place, matching a tenth of the events;
+* ``narrow``: a number in the names of about a hundred events.
+
+BM25 ranks at most ``SEARCH_MAX_MATCHES`` matches per search (see
+:mod:`search`), but it also reads the whole index entry of every searched
+word to weigh it, and the last word, matched as a prefix, is expanded in
+full. Queries of words most events share therefore stay well above the
+budget at a million events; the narrow one shows the cost of a typical
+search. The script exits with status 1 if any request fails or the p95 of
+any query reaches ``--budget-ms``.
+
+Usage::
+
+    python -m benchmarks.search --events 1000000 --requests 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+import search
+from main import app
+from benchmarks.asgi import call, load
+from benchmarks.scratch import scratch_database, use_database
+from benchmarks.suite import seed
+
+QUERIES = {
+    "broad": "synthetic",
+    "place": "hall 3",
+    "narrow": "4242",
+}
+
+
+async def next_page_url(url: str) -> str:
+    status, _, body = await call(app, "GET", url)
+    if status != 200:
+        raise RuntimeError(f"GET {url} answered {status}")
+    cursor = json.loads(body)["next_cursor"]
+    return f"{url}&cursor={cursor}" if cursor else url
+
+
+async def run(args) -> dict:
+    started = time.perf_counter()
+    path = scratch_database()
+    seed(path, 1, args.events, 0, 0, 0, random.Random(args.seed))
+    results = {"events": args.events, "max_matches": search.MAX_MATCHES,
+               "seed_seconds": round(time.perf_counter() - started, 1)}
+
+    engines = use_database(app, path)
+    try:
+        for name, query in QUERIES.items():
+            first = f"/events/search?q={query.replace(' ', '+')}&limit=20"
+            for page, url in (("first", first), ("next", await next_page_url(first))):
+                # Warm the page cache, as a running server would have.
+                await load(app, lambda i: ("GET", url, {}, b""), 5, 1)
+                results[f"{name}_{page}"] = await load(app, lambda i: ("GET", url, {}, b""), args.requests, 1)
+    finally:
+        for engine in engines:
+            await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=100, help="requests per query and page")
+    parser.add_argument("--budget-ms", type=float, default=10.0, help="p95 each query must stay under")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    measured = [result for result in results.values() if isinstance(result, dict)]
+    results["ok"] = all(not result["errors"] and result["p95_ms"] < args.budget_ms for result in measured)
+    print(json.dumps(results, indent=2))
+    if not results["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
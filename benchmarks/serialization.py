@@ -0,0 +1,94 @@
+"""
+Per-row cost of the fast list serialization against the response_model path.
+
+The response_model path is what the list endpoints did before: load ORM
+objects, build a pydantic object per row, then let FastAPI validate the list
+against the route's ``response_model``, serialize it and encode it with
+JSONResponse. The fast path selects the schema's columns as rows and encodes
+them with one ``pydantic_core.to_json`` call. Both produce the same bytes.
+
+Usage::
+
+    python -m benchmarks.serialization --rows 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+import serialization
+from benchmarks.scratch import scratch_database
+
+CASES = {
+    "tickets": (models.Ticket, schemas.TicketOut),
+    "feedbacks": (models.Feedback, schemas.FeedbackOut),
+}
+
+
+def seed(path, rows):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"username": "buyer", "password": "x"}])
+        conn.execute(insert(models.Event), [{"name": "Event", "description": "d"}])
+        conn.execute(insert(models.Ticket), [
+            {"event_id": 1, "user_id": 1, "price": 10.0, "status": models.TicketStatuses.bought} for _ in range(rows)])
+        conn.execute(insert(models.Feedback), [
+            {"event_id": 1, "user_id": 1, "rating": 4, "comment": f"comment {i}"} for i in range(rows)])
+    return engine
+
+
+def response_model_path(db, model, schema, field):
+    objects = db.scalars(select(model).where(model.event_id == 1).order_by(model.id)).all()
+    content = [schema.model_validate(obj) for obj in objects]
+    content = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(content).body
+
+
+def fast_path(db, model, schema):
+    rows = db.execute(serialization.select_fields(model, schema).where(model.event_id == 1).order_by(model.id))
+    return serialization.encode_rows(schema, rows)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = seed(scratch_database(), args.rows)
+    results = {}
+    for name, (model, schema) in CASES.items():
+        field = create_model_field(name="Response", type_=list[schema], mode="serialization")
+        with Session(engine) as db:
+            slow, slow_body = timed(lambda: response_model_path(db, model, schema, field), args.repeat)
+            db.expunge_all()
+            fast, fast_body = timed(lambda: fast_path(db, model, schema), args.repeat)
+        assert json.loads(slow_body) == json.loads(fast_body), f"{name}: bodies differ"
+        results[name] = {
+            "response_model_us_per_row": round(slow / args.rows * 1e6, 2),
+            "fast_us_per_row": round(fast / args.rows * 1e6, 2),
+            "speedup": round(slow / fast, 1),
+        }
+    engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
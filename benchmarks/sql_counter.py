@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """
+    Statements executed on the counted engines while the counter is active.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engines):
+    """
+    Count the SQL statements ``engines`` (one sync or async engine, or a tuple
+    of them) execute inside the block.
+
+    Usage::
+
+        with count_queries(engine) as queries:
+            await call(app, "GET", "/")
+        print(queries.count, queries.statements)
+    """
+    engines = engines if isinstance(engines, (tuple, list)) else (engines,)
+    engines = [getattr(engine, "sync_engine", engine) for engine in engines]
+    counter = QueryCounter()
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", counter._record)
+    try:
+        yield counter
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", counter._record)
+
+
+@contextmanager
+def assert_max_queries(engines, limit: int):
+    """
+    Fail with an AssertionError listing the statements if the block runs more
+    than ``limit`` of them.
+    """
+    with count_queries(engines) as counter:
+        yield counter
+    assert counter.count <= limit, (
+        f"expected at most {limit} queries, got {counter.count}:\n" + "\n".join(counter.statements))
@@ -0,0 +1,127 @@
+"""
+Measure how long a fresh worker takes to serve its first pages.
+
+Each run starts a new interpreter that imports ``main``, runs the app's
+lifespan startup (engines, migrations check) and requests a few pages twice
+in-process: the first request to a page pays for loading its template and
+opening the database connections, the second shows the steady state. Runs
+are repeated under three template cache setups and the medians reported:
+
+* ``no_bytecode_cache``: every worker compiles the templates it renders;
+* ``cold_bytecode_cache``: an empty cache directory, as on a first deploy;
+* ``warm_bytecode_cache``: a directory filled by ``python templating.py``.
+
+Usage::
+
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from benchmarks.asgi import call
+
+MODES = ("no_bytecode_cache", "cold_bytecode_cache", "warm_bytecode_cache")
+
+
+def pages(event_id):
+    return {
+        "home": "/?limit=20",
+        "login": "/login",
+        "register": "/register",
+        "event": f"/events/{event_id}",
+    }
+
+
+def ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+async def serve_first_requests(app, event_id) -> dict:
+    timings = {}
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        timings["startup_ms"] = ms(time.perf_counter() - started)
+        for attempt in ("first", "second"):
+            for name, url in pages(event_id).items():
+                started = time.perf_counter()
+                status, _, _ = await call(app, "GET", url)
+                if status != 200:
+                    raise RuntimeError(f"GET {url} answered {status}")
+                timings[f"{attempt}_{name}_ms"] = ms(time.perf_counter() - started)
+    return timings
+
+
+def child(event_id):
+    """
+    The measured worker: import the app, start it and serve the pages once.
+    """
+    started = time.perf_counter()
+    import main
+    timings = {"import_ms": ms(time.perf_counter() - started)}
+    timings.update(asyncio.run(serve_first_requests(main.app, event_id)))
+    timings["total_ms"] = ms(time.perf_counter() - started)
+    print(json.dumps(timings))
+
+
+def run_child(env, event_id) -> dict:
+    output = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child", str(event_id)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def run(args) -> dict:
+    # Imported here so that a --child run measures its own import of the app.
+    from benchmarks.scratch import scratch_database
+    from benchmarks.suite import seed
+
+    path = scratch_database()
+    _, event_ids = seed(path, args.users, args.events, 0, 0, 0, random.Random(args.seed))
+    base_env = {**os.environ, "DB_URL": f"sqlite:///{path}"}
+    base_env.pop("DB_READ_URLS", None)
+
+    warm_dir = tempfile.mkdtemp()
+    subprocess.run([sys.executable, "templating.py", "--cache-dir", warm_dir], env=base_env,
+                   capture_output=True, check=True)
+
+    results = {}
+    for mode in MODES:
+        runs = []
+        for _ in range(args.runs):
+            if mode == "no_bytecode_cache":
+                env = {**base_env, "TEMPLATE_BYTECODE_CACHE": "0"}
+            elif mode == "cold_bytecode_cache":
+                env = {**base_env, "TEMPLATE_CACHE_DIR": tempfile.mkdtemp()}
+            else:
+                env = {**base_env, "TEMPLATE_CACHE_DIR": warm_dir}
+            runs.append(run_child(env, event_ids[0]))
+        results[mode] = {name: round(statistics.median(run[name] for run in runs), 2) for name in runs[0]}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="workers started per mode")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", type=int, metavar="EVENT_ID", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        child(args.child)
+        return
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
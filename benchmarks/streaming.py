@@ -0,0 +1,80 @@
+"""
+Compare peak memory of the buffered and streamed ticket listings.
+
+Seeds one event with many tickets and fetches its listing once per mode,
+measuring the peak of Python allocations (tracemalloc) while the response is
+produced. The body is consumed chunk by chunk, so only the server side counts.
+
+Usage::
+
+    python -m benchmarks.streaming --tickets 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from sqlalchemy import create_engine, insert
+
+import models
+from cache import event_cache
+from main import app
+from benchmarks.asgi import call
+from benchmarks.scratch import scratch_database, use_database
+
+MODES = {"buffered": "", "ndjson": "?stream=ndjson", "json": "?stream=json"}
+
+
+def seed(path, tickets):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"username": "buyer", "password": "x"}])
+        conn.execute(insert(models.Event), [{"name": "Stadium", "description": "d"}])
+        conn.execute(insert(models.Ticket), [
+            {"event_id": 1, "user_id": 1, "price": 10.0, "status": models.TicketStatuses.bought}
+            for _ in range(tickets)
+        ])
+    engine.dispose()
+
+
+async def measure(url):
+    size = 0
+
+    def on_body(chunk):
+        nonlocal size
+        size += len(chunk)
+
+    event_cache.clear()
+    tracemalloc.start()
+    started = time.perf_counter()
+    status, _, _ = await call(app, "GET", url, on_body=on_body)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"status": status, "bytes": size, "seconds": round(elapsed, 3), "peak_mib": round(peak / 2 ** 20, 1)}
+
+
+async def run(args):
+    path = scratch_database()
+    seed(path, args.tickets)
+    engines = use_database(app, path)
+    results = {mode: await measure(f"/events/1/tickets{query}") for mode, query in MODES.items()}
+    for engine in engines:
+        await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=100000)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Load-test the main user flows and keep the numbers as a JSON baseline.
+
+A synthetic dataset of configurable size (users, events, tickets, favorites,
+feedbacks) is seeded into a scratch database, then every scenario is run
+against the real application, both in-process through ASGI and over HTTP
+against a uvicorn server started for the run. Each transport gets its own
+copy of the dataset, since the write scenarios change it.
+
+Every scenario reports throughput and p50/p95/p99 latency. ``--save`` writes
+the results as a baseline; ``--baseline`` compares the run against one and
+exits with status 1 if a scenario lost more than ``--tolerance`` of its
+throughput or its p95 latency grew by more than that.
+
+Usage::
+
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from sqlalchemy import create_engine, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import auth
+import database
+import models
+import stats
+from main import app, password_hasher
+from passwords import pwd_context
+from benchmarks.asgi import load
+from benchmarks.scratch import scratch_database, use_database
+
+PASSWORD = "benchmark"
+PAGE = 20
+SCENARIOS = ("homepage", "login", "events", "buy_ticket", "favorites")
+TRANSPORTS = ("in_process", "uvicorn")
+FORM = "application/x-www-form-urlencoded"
+
+
+def seed(path, users, events, tickets, favorites, feedbacks, rng):
+    """
+    Fill the scratch database at ``path`` and bring the counters in line.
+
+    Returns:
+        tuple[list[int], list[int]]: The user and event ids.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    hashed = pwd_context.hash(PASSWORD)
+    start = datetime(2030, 1, 1)
+    with engine.begin() as conn:
+        def insert_rows(table, rows):
+            if rows:
+                conn.execute(insert(table), rows)
+
+        insert_rows(models.User, [{"username": f"user{i}", "password": hashed} for i in range(users)])
+        insert_rows(models.Event, [
+            {"name": f"Event {i}", "description": "Synthetic event", "place": f"Hall {i % 10}",
+             "price": float(10 + i % 50), "date": start + timedelta(hours=i)}
+            for i in range(events)
+        ])
+        user_ids = conn.scalars(select(models.User.id)).all()
+        event_ids = conn.scalars(select(models.Event.id)).all()
+        insert_rows(models.Ticket, [
+            {"event_id": rng.choice(event_ids), "user_id": rng.choice(user_ids), "price": 10.0,
+             "status": models.TicketStatuses.bought}
+            for _ in range(tickets)
+        ])
+        pairs = {(rng.choice(user_ids), rng.choice(event_ids)) for _ in range(favorites)}
+        insert_rows(models.favourites_table,
+                    [{"user_id": user_id, "event_id": event_id} for user_id, event_id in pairs])
+        insert_rows(models.Feedback, [
+            {"event_id": rng.choice(event_ids), "user_id": rng.choice(user_ids), "rating": rng.randint(1, 5),
+             "comment": "Synthetic feedback"}
+            for _ in range(feedbacks)
+        ])
+        sold = select(func.count()).where(models.Ticket.event_id == models.Event.id,
+                                          models.Ticket.status == models.TicketStatuses.bought)
+        conn.execute(update(models.Event).values(tickets_sold=sold.scalar_subquery()))
+    engine.dispose()
+    return user_ids, event_ids
+
+
+async def rebuild_stats(path):
+    engine = database.make_async_engine(f"sqlite:///{path}")
+    async with AsyncSession(engine) as db:
+        await stats.rebuild(db)
+    await engine.dispose()
+
+
+def scenarios(user_ids, event_ids):
+    """
+    Request factories per scenario: ``make(i)`` -> ``(method, url, headers, body)``.
+    """
+    cookies = [f"access_token={auth.create_token({'sub': str(user_id)})}" for user_id in user_ids]
+
+    def user(i, **headers):
+        return {"cookie": cookies[i % len(cookies)], **headers}
+
+    def homepage(i):
+        return "GET", f"/?limit={PAGE}", user(i), b""
+
+    def login(i):
+        body = urlencode({"username": f"user{i % len(user_ids)}", "password": PASSWORD}).encode()
+        return "POST", "/login", {"content-type": FORM}, body
+
+    def events(i):
+        return "GET", f"/events?limit={PAGE}", user(i), b""
+
+    def buy_ticket(i):
+        body = f"event_id={event_ids[i * 7 % len(event_ids)]}".encode()
+        return "POST", "/tickets", user(i, **{"content-type": FORM}), body
+
+    def favorites(i):
+        # Consecutive requests add and then remove the same favorite.
+        pair = i // 2
+        body = f"event_id={event_ids[pair * 13 % len(event_ids)]}".encode()
+        url = "/add-to-favorites" if i % 2 == 0 else "/remove-from-favorites"
+        return "POST", url, user(pair, **{"content-type": FORM}), body
+
+    return {"homepage": homepage, "login": login, "events": events, "buy_ticket": buy_ticket,
+            "favorites": favorites}
+
+
+class HTTPClient:
+    """
+    A minimal keep-alive HTTP/1.1 client with a connection per concurrent caller.
+
+    Its :meth:`call` has the shape :func:`benchmarks.asgi.load` expects of ``send``.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.idle = []
+
+    async def call(self, method: str, url: str, headers: dict = None, body: bytes = b""):
+        reader, writer = self.idle.pop() if self.idle else await asyncio.open_connection(self.host, self.port)
+        head = [f"{method} {url} HTTP/1.1", f"host: {self.host}:{self.port}", f"content-length: {len(body)}"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        try:
+            status, response_headers, content = await self._read_response(reader, method)
+        except Exception:
+            writer.close()
+            raise
+        if response_headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self.idle.append((reader, writer))
+        return status, list(response_headers.items()), content
+
+    @staticmethod
+    async def _read_response(reader, method):
+        status_line, *lines = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        for line in filter(None, lines):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if method == "HEAD" or status in (204, 304):
+            return status, headers, b""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16):
+                chunks.append((await reader.readexactly(size + 2))[:-2])
+            while await reader.readuntil(b"\r\n") != b"\r\n":
+                pass  # trailers
+            return status, headers, b"".join(chunks)
+        return status, headers, await reader.readexactly(int(headers.get("content-length", 0)))
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(path: str, port: int) -> subprocess.Popen:
+    """
+    Serve the app with uvicorn on ``port`` against the database at ``path``.
+    """
+    env = {**os.environ, "DB_URL": f"sqlite:///{path}"}
+    env.pop("DB_READ_URLS", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start in time")
+
+
+async def run_scenarios(factories, args, client: HTTPClient = None):
+    results = {}
+    for name in args.scenarios:
+        total = args.login_requests if name == "login" else args.requests
+        results[name] = await load(app, factories[name], total, args.concurrency, send=client and client.call)
+        if client:
+            # The server drops connections idle for longer than its keep-alive timeout.
+            client.close()
+    return results
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    path = scratch_database()
+    user_ids, event_ids = seed(path, args.users, args.events, args.tickets, args.favorites, args.feedbacks, rng)
+    await rebuild_stats(path)
+    factories = scenarios(user_ids, event_ids)
+
+    results = {"config": {
+        **{name: getattr(args, name) for name in ("users", "events", "tickets", "favorites", "feedbacks",
+                                                  "requests", "login_requests", "concurrency", "seed")},
+        "python": platform.python_version(),
+        "created": datetime.utcnow().isoformat(timespec="seconds"),
+    }}
+
+    if "in_process" in args.transports:
+        copy = os.path.join(os.path.dirname(path), "in_process.db")
+        shutil.copyfile(path, copy)
+        engines = use_database(app, copy)
+        try:
+            results["in_process"] = await run_scenarios(factories, args)
+        finally:
+            app.dependency_overrides.clear()
+            for engine in engines:
+                await engine.dispose()
+
+    if "uvicorn" in args.transports:
+        copy = os.path.join(os.path.dirname(path), "uvicorn.db")
+        shutil.copyfile(path, copy)
+        port = free_port()
+        server = start_server(copy, port)
+        client = HTTPClient("127.0.0.1", port)
+        try:
+            results["uvicorn"] = await run_scenarios(factories, args, client)
+        finally:
+            client.close()
+            server.terminate()
+            server.wait()
+    return results
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> dict:
+    """
+    Relative change of rps and p95 per transport and scenario present in both runs.
+
+    Returns:
+        dict: ``{"changes": {...}, "regressions": [...]}``; a regression is a
+        drop in rps or a rise in p95 latency beyond ``tolerance``.
+    """
+    changes, regressions = {}, []
+    for transport in TRANSPORTS:
+        for name, now in current.get(transport, {}).items():
+            before = baseline.get(transport, {}).get(name)
+            if not before:
+                continue
+            rps = now["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+            p95 = now["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+            key = f"{transport}/{name}"
+            changes[key] = {"rps": f"{before['rps']} -> {now['rps']} ({rps:+.1%})",
+                            "p95_ms": f"{before['p95_ms']} -> {now['p95_ms']} ({p95:+.1%})"}
+            if rps < -tolerance or p95 > tolerance:
+                regressions.append(key)
+    return {"changes": changes, "regressions": regressions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--tickets", type=int, default=20000)
+    parser.add_argument("--favorites", type=int, default=5000)
+    parser.add_argument("--feedbacks", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=100,
+                        help="requests for the login scenario, which is bound by bcrypt")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--transports", nargs="+", choices=TRANSPORTS, default=list(TRANSPORTS))
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare the results against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        password_hasher.shutdown()
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if not args.baseline:
+        print(json.dumps(results, indent=2))
+        return
+    with open(args.baseline) as file:
+        report = compare(json.load(file), results, args.tolerance)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
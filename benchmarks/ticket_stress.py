@@ -0,0 +1,95 @@
+"""
+Hammer ``buy_ticket`` for one hot event and check nothing is oversold.
+
+Many more purchases than there are seats are fired concurrently through the
+real application. Every request must be answered with a purchase (303) or
+sold out (409), and afterwards the number of bought tickets, the event's
+``tickets_sold`` counter and the capacity must all agree; the script exits
+with status 1 if any request failed (5xx, or an exception, which counts as
+500) or the counts do not agree.
+
+Usage::
+
+    python -m benchmarks.ticket_stress --capacity 500 --requests 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+import auth
+import models
+from main import app
+from benchmarks.asgi import load
+from benchmarks.scratch import scratch_database, use_database
+
+
+def seed(path, capacity, users):
+    engine = create_engine(f"sqlite:///{path}")
+    with Session(engine) as db:
+        event = models.Event(name="Hot event", description="stress", price=10.0, capacity=capacity)
+        db.add(event)
+        db.add_all(models.User(username=f"buyer{i}", password="x") for i in range(users))
+        db.commit()
+        event_id = event.id
+        user_ids = db.scalars(select(models.User.id)).all()
+    engine.dispose()
+    return event_id, user_ids
+
+
+def count(path, event_id):
+    engine = create_engine(f"sqlite:///{path}")
+    with Session(engine) as db:
+        bought = db.scalar(select(func.count()).select_from(models.Ticket).where(
+            models.Ticket.event_id == event_id, models.Ticket.status == models.TicketStatuses.bought))
+        sold = db.scalar(select(models.Event.tickets_sold).where(models.Event.id == event_id))
+    engine.dispose()
+    return bought, sold
+
+
+async def run(args):
+    path = scratch_database()
+    event_id, user_ids = seed(path, args.capacity, args.users)
+    engines = use_database(app, path)
+
+    headers = [
+        {
+            "cookie": f"access_token={auth.create_token({'sub': str(user_id)})}",
+            "content-type": "application/x-www-form-urlencoded",
+        }
+        for user_id in user_ids
+    ]
+    body = f"event_id={event_id}".encode()
+    result = await load(app, lambda i: ("POST", "/tickets", headers[i % len(headers)], body),
+                        args.requests, args.concurrency)
+    for engine in engines:
+        await engine.dispose()
+
+    bought, sold = count(path, event_id)
+    result.update({"capacity": args.capacity, "tickets_bought": bought, "tickets_sold": sold})
+    failed = sum(n for status, n in result["statuses"].items() if status >= 500)
+    result["ok"] = not failed and bought == sold == min(args.capacity, result["statuses"].get(303, 0))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--capacity", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--users", type=int, default=100)
+    result = asyncio.run(run(parser.parse_args()))
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A bounded, thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Every operation takes a lock, so it can be shared with code running outside
+    the event loop's thread. On the loop itself, the race to guard against is
+    an :meth:`invalidate` landing while :meth:`get_or_load` awaits its loader;
+    see there. ``hits``, ``misses``, ``evictions`` and ``expirations`` count what the
+    cache did since it was created (or since :meth:`clear`).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Keys being loaded: [loads in flight, generation bumped by invalidate()].
+        self._loads = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key, loader):
+        """
+        Return the cached value for ``key``, awaiting ``loader()`` on a miss.
+
+        ``None`` results are returned but not cached, so a missing row does not
+        shadow one that is created later. Nor is a result cached if ``key`` was
+        invalidated while it loaded: it may have been read before the write
+        that invalidated it, and would hide that write until it expired.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            load = self._loads.setdefault(key, [0, 0])
+            load[0] += 1
+            generation = load[1]
+        try:
+            value = await loader()
+        finally:
+            with self._lock:
+                load[0] -= 1
+                if not load[0]:
+                    del self._loads[key]
+                if value is not None and load[1] == generation:
+                    self._store(key, value)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                load = self._loads.get(key)
+                if load is not None:
+                    load[1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            for load in self._loads.values():
+                load[1] += 1
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class FragmentCache:
+    """
+    A thread-safe LRU cache of rendered template fragments, bounded by the
+    total size of the fragments in bytes.
+
+    Keys identify the content a fragment was rendered from (its version), so
+    entries never go stale and need no TTL: when the content changes the new
+    version misses and the old fragment ages out. ``render_seconds`` is the
+    time spent rendering on misses.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.render_seconds = 0.0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, fragment: str):
+        size = len(fragment.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[0]
+            self._data[key] = (size, fragment)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (evicted, _) = self._data.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def get_or_render(self, key, render) -> str:
+        """
+        Return the cached fragment for ``key``, calling ``render()`` on a miss.
+        """
+        fragment = self.get(key)
+        if fragment is None:
+            started = time.perf_counter()
+            fragment = render()
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.render_seconds += elapsed
+            self.set(key, fragment)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = 0
+            self.render_seconds = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "render_seconds": self.render_seconds,
+            }
+
+
+# Event details and their sub-resource listings, keyed by (kind, event_id).
+event_cache = TTLCache(
+    maxsize=int(os.getenv("EVENT_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("EVENT_CACHE_TTL", "60")),
+)
+
+
+def invalidate_event(event_id: int, *kinds: str):
+    """
+    Drop the cached ``kinds`` (e.g. ``"event"``, ``"tickets"``) of one event.
+    """
+    event_cache.invalidate(*((kind, event_id) for kind in kinds))
+
+
+# Authenticated principals (schemas.UserOut) keyed by user id. Kept short-lived
+# so a deleted or renamed user cannot linger for long even without invalidation.
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+)
+
+
+# The (user id, expiry) of access tokens whose signature was verified, keyed by
+# the token. The rate limiter and the user dependency both need the user of a
+# request, and a client sends the same token with every request.
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", "300")),
+)
+
+
+# Rendered event card grids of the homepage, keyed by the version of the event set.
+fragment_cache = FragmentCache(max_bytes=int(os.getenv("FRAGMENT_CACHE_BYTES", str(8 * 1024 * 1024))))
@@ -0,0 +1,230 @@
+import itertools
+import math
+import os
+import time
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import metrics
+
+load_dotenv()
+
+# Heroku-style postgres:// URLs are not accepted by SQLAlchemy 2.
+DB_URL = (os.getenv("DB_URL") or "sqlite:///./simple.db").replace("postgres://", "postgresql://", 1)
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer instead of queueing behind the rollback journal; NORMAL
+# synchronous is durable across application crashes in WAL mode.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+}
+
+# SQLite takes one writer at a time. More write connections only move the queue
+# into busy_timeout, which fails with "database is locked" when it runs out;
+# with one, writers queue in the pool instead, for up to pool_timeout.
+SQLITE_WRITE_POOL = {"pool_size": 1, "max_overflow": 0}
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_url(url: str) -> str:
+    """
+    Swap the driver of a sync database URL for its asyncio counterpart.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend!r}")
+    return url.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def _engine_options(url: str) -> dict:
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return {**POOL_OPTIONS, "pool_pre_ping": True}
+    if url.database in (None, "", ":memory:"):
+        # In-memory databases live and die with a single connection.
+        return {}
+    return {**POOL_OPTIONS, **SQLITE_WRITE_POOL, "connect_args": {"check_same_thread": False}}
+
+
+def _install_pragmas(engine: Engine, pragmas: dict):
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+def make_engine(url: str = DB_URL, pragmas: dict = None, **options) -> Engine:
+    """
+    Build a sync engine for ``url`` with the tuned pool and, for SQLite, pragmas.
+
+    ``options`` are passed to ``create_engine`` and override the defaults.
+    """
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    engine = create_engine(url, **{**_engine_options(url), **options})
+    if engine.dialect.name == "sqlite":
+        _install_pragmas(engine, pragmas)
+    metrics.instrument_engine(engine)
+    return engine
+
+
+def make_async_engine(url: str = DB_URL, pragmas: dict = None, **options) -> AsyncEngine:
+    """
+    Build an async engine for ``url`` (given with its sync driver) configured
+    like :func:`make_engine`.
+    """
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    options = {**_engine_options(url), **options}
+    options.get("connect_args", {}).pop("check_same_thread", None)
+    engine = create_async_engine(async_url(url), **options)
+    if engine.dialect.name == "sqlite":
+        _install_pragmas(engine.sync_engine, pragmas)
+    metrics.instrument_engine(engine.sync_engine)
+    return engine
+
+
+def make_read_engine(url: str = DB_URL, **options) -> AsyncEngine:
+    """
+    Build an async engine whose connections refuse writes.
+
+    SQLite connections get ``PRAGMA query_only``; PostgreSQL sessions default
+    to read-only transactions.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "postgresql":
+        options.setdefault("connect_args", {"server_settings": {"default_transaction_read_only": "on"}})
+    elif parsed.database not in (None, "", ":memory:"):
+        # SQLite readers do not take the write lock, so they keep the full pool.
+        options = {"pool_size": POOL_OPTIONS["pool_size"], "max_overflow": POOL_OPTIONS["max_overflow"], **options}
+    return make_async_engine(url, pragmas={**SQLITE_PRAGMAS, "query_only": "ON"}, **options)
+
+
+DB_READ_URLS = [url.strip() for url in os.getenv("DB_READ_URLS", "").split(",") if url.strip()]
+
+# Built by create_engines() on first use, not on import.
+ENGINE_ATTRIBUTES = frozenset({"engine", "Sessionlocal", "async_engine", "AsyncSessionlocal",
+                               "primary_read_engine", "read_engines", "PrimaryReadSessionlocal"})
+_engines_created = False
+
+
+def create_engines():
+    """
+    Build the engines and session factories of ``DB_URL`` and ``DB_READ_URLS``.
+
+    They are built on first use rather than on import, so importing the app
+    (to fork workers, or in a script that never queries) costs no engine; the
+    app's lifespan builds them on startup. Calling it again is a no-op.
+    """
+    global engine, Sessionlocal, async_engine, AsyncSessionlocal
+    global primary_read_engine, read_engines, PrimaryReadSessionlocal, _read_sessions, _engines_created
+    if _engines_created:
+        return
+    # The sync engine is only used for schema setup and scripts; requests go through async_engine.
+    engine = make_engine()
+    Sessionlocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    async_engine = make_async_engine()
+    AsyncSessionlocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    # Reads never share the write pool: a write request that also resolves its user
+    # holds one connection of each kind, and drawing both from one pool deadlocks
+    # once every connection is held by a request waiting for a second one.
+    # Without DB_READ_URLS reads go to a read-only pool on the primary; with SQLite
+    # in WAL mode it reads alongside the writer.
+    primary_read_engine = make_read_engine()
+    read_engines = [make_read_engine(url) for url in DB_READ_URLS] or [primary_read_engine]
+    PrimaryReadSessionlocal = async_sessionmaker(bind=primary_read_engine, autoflush=False, expire_on_commit=False)
+    _read_sessions = itertools.cycle([
+        async_sessionmaker(bind=read_engine, autoflush=False, expire_on_commit=False) for read_engine in read_engines
+    ])
+    _engines_created = True
+
+
+def __getattr__(name):
+    # database.engine and friends: build them when first asked for.
+    if name in ENGINE_ATTRIBUTES:
+        create_engines()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# After a user writes, their reads stay on the primary for this long so they see
+# their own purchase or favorite even if a replica lags behind.
+STICKY_COOKIE = "db_primary_until"
+STICKY_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+
+def stick_to_primary(response: Response) -> Response:
+    """
+    Route the client's reads to the primary for the next ``STICKY_SECONDS``.
+    """
+    response.set_cookie(STICKY_COOKIE, f"{time.time() + STICKY_SECONDS:.3f}",
+                        max_age=math.ceil(STICKY_SECONDS), httponly=True, samesite="lax")
+    return response
+
+
+def _is_sticky(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_write_sessions() -> async_sessionmaker:
+    """
+    The session factory of the primary, for work that outlives a request's
+    own session (e.g. batched writes).
+    """
+    create_engines()
+    return AsyncSessionlocal
+
+
+async def get_write_db():
+    async with get_write_sessions()() as db:
+        yield db
+
+
+def get_read_sessions(request: Request) -> async_sessionmaker:
+    """
+    Pick the read-only session factory for a request: the next read engine,
+    or the primary while the client is within its read-your-writes window.
+
+    Streaming responses use it directly, since a yield dependency's session
+    is closed before the response body is sent.
+    """
+    create_engines()
+    return PrimaryReadSessionlocal if _is_sticky(request) else next(_read_sessions)
+
+
+async def get_read_db(request: Request):
+    async with get_read_sessions(request)() as db:
+        yield db
+
+
+async def dispose_engines():
+    """
+    Close the pooled connections of the primary and every read engine.
+    """
+    if not _engines_created:
+        return
+    for db_engine in {async_engine, primary_read_engine, *read_engines}:
+        await db_engine.dispose()
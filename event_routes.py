@@ -1,35 +1,133 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import RedirectResponse, HTMLResponse
-from sqlalchemy.orm import Session
-from models import get_db, favourites_table, User, Event
-import models, schemas
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_read_db, get_read_sessions, get_write_db, get_write_sessions, stick_to_primary
+from models import Event
+import models, schemas, favorites, ingest, jobs, live, ratelimit, stats, httpcache, serialization, streaming
 from auth import get_current_user
-from fastapi.templating import Jinja2Templates
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, event_page_params, fetch_event_page
+from search import search_events
+from cache import event_cache, invalidate_event
 
 router = APIRouter()
 
-templates = Jinja2Templates(directory="static")
+
+async def load_event(db: AsyncSession, event_id: int) -> Optional[schemas.EventOut]:
+    """
+    Fetch an event through the event cache.
+    """
+    async def load():
+        event = await db.get(models.Event, event_id)
+        return schemas.EventOut.model_validate(event) if event else None
+
+    return await event_cache.get_or_load(("event", event_id), load)
 
 
-@router.get("/events", response_model=list[schemas.EventOut])
-def get_all_events(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+async def event_listing(request: Request, db: AsyncSession, kind: str, event_id: int, model, schema):
     """
-    Retrieve a list of all events.
+    Serve the ``model`` rows of an event as a cached JSON ``list[schema]``,
+    validated by the event's version.
 
-    Returns all available events from the database.
+    Writes to the children touch the event, so the listing is unchanged for as
+    long as the event's ``updated_at`` is; a matching conditional request gets
+    a 304 without loading the listing. The encoded body is what gets cached.
+    """
+    event = await load_event(db, event_id)
+    headers = {}
+    if event is not None:
+        headers = httpcache.cache_headers(httpcache.make_etag(kind, event_id, event.updated_at), event.updated_at)
+        if httpcache.is_fresh(request, headers):
+            return httpcache.not_modified(headers)
+
+    async def load():
+        rows = await db.execute(
+            serialization.select_fields(model, schema).where(model.event_id == event_id).order_by(model.id))
+        return serialization.encode_rows(schema, rows)
+
+    return serialization.RawJSONResponse(await event_cache.get_or_load((kind, event_id), load), headers=headers)
+
+
+@router.get("/events", response_model=schemas.EventPage, dependencies=[ratelimit.rate_limit("list_events")])
+async def get_all_events(request: Request, db: AsyncSession = Depends(get_read_db),
+                   user: schemas.UserOut = Depends(get_current_user), page: dict = Depends(event_page_params)):
+    """
+    Retrieve a page of events.
+
+    Events are ordered by date and paginated with an opaque cursor. They can be
+    filtered by date range (``date_from`` inclusive, ``date_to`` exclusive),
+    place and price range.
+
+    Returns:
+        EventPage: The events on the requested page and the cursor of the next
+        page (``None`` on the last page).
+    """
+    events, next_cursor = await fetch_event_page(db, **page)
+    headers = httpcache.cache_headers(httpcache.make_etag("events", httpcache.versions(events), next_cursor),
+                                      cache_control=httpcache.PRIVATE)
+    if httpcache.is_fresh(request, headers):
+        return httpcache.not_modified(headers)
+    return serialization.RawJSONResponse(serialization.encode_page(schemas.EventOut, events, next_cursor),
+                                         headers=headers)
+
+
+@router.get("/events/search", response_model=schemas.EventPage)
+async def search(request: Request, q: str = Query(min_length=1), cursor: Optional[str] = None,
+                 limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                 db: AsyncSession = Depends(get_read_db)):
+    """
+    Full-text search over event names, descriptions, places, speakers and sponsors.
+
+    Every word of ``q`` must match (the last one as a prefix). Results are
+    ranked with BM25, best first, and paginated with an opaque cursor.
 
     Returns:
-        List[eventOut]: A list of event objects.
+        EventPage: The matching events on the requested page and the cursor of
+        the next page (``None`` on the last page).
+
+    Raises:
+        HTTPException: If the database does not support full-text search.
     """
-    
-    return db.query(models.Event).all()
+    if db.get_bind().dialect.name != "sqlite":
+        raise HTTPException(status_code=501, detail="Search requires SQLite FTS5")
+    events, next_cursor = await search_events(db, q, limit, cursor)
+    headers = httpcache.cache_headers(httpcache.make_etag("search", httpcache.versions(events), next_cursor))
+    if httpcache.is_fresh(request, headers):
+        return httpcache.not_modified(headers)
+    return serialization.RawJSONResponse(serialization.encode_page(schemas.EventOut, events, next_cursor),
+                                         headers=headers)
+
+
+@router.get("/events/live")
+async def follow_events(event_ids: list[int] = Query(alias="id", min_length=1, max_length=live.MAX_EVENTS_PER_STREAM),
+                        db: AsyncSession = Depends(get_read_db)):
+    """
+    Stream the changes of several events as server-sent events.
+
+    Takes the events as repeated ``id`` parameters (``/events/live?id=1&id=2``)
+    and sends the ticket, favorite and feedback changes of all of them over
+    one connection. IDs of events that do not exist are ignored.
+
+    Raises:
+        HTTPException: If none of the events exist (404), or too many streams
+        are open (503).
+    """
+    existing = (await db.scalars(select(Event.id).where(Event.id.in_(set(event_ids))))).all()
+    if not existing:
+        raise HTTPException(404, detail="Event not found")
+    return live.stream_response(existing)
 
 
 @router.get("/events/{event_id}", response_model=schemas.EventOut)
-def get_event(event_id: int, db: Session = Depends(get_db)):
+async def get_event(event_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve a single event by its ID.
 
+    The response carries an ETag and Last-Modified derived from the event's
+    version and may be cached publicly; conditional requests get a 304.
+
     Args:
         event_id (int): The ID of the event to retrieve.
 
@@ -39,14 +137,18 @@ def get_event(event_id: int, db: Session = Depends(get_db)):
     Raises:
         HTTPException: If the event with the specified ID is not found.
     """
-    event = db.query(models.Event).get(event_id)
+    event = await load_event(db, event_id)
     if not event:
         raise HTTPException(404, detail="Event not found")
+    headers = httpcache.cache_headers(httpcache.make_etag("event", event_id, event.updated_at), event.updated_at)
+    if httpcache.is_fresh(request, headers):
+        return httpcache.not_modified(headers)
+    response.headers.update(headers)
     return event
 
 
 @router.post("/events", response_model=schemas.EventOut)
-def create_event(event: schemas.EventCreate, db: Session = Depends(get_db)):
+async def create_event(event: schemas.EventCreate, db: AsyncSession = Depends(get_write_db)):
     """
     Create a new event.
 
@@ -58,52 +160,194 @@ def create_event(event: schemas.EventCreate, db: Session = Depends(get_db)):
     """
     new_event = models.Event(**event.dict())
     db.add(new_event)
-    db.commit()
-    db.refresh(new_event)
+    await db.commit()
+    await db.refresh(new_event)
+    invalidate_event(new_event.id, "event")
     return new_event
 
 
-@router.post("/tickets")
+@router.post("/import/{kind}")
+async def bulk_import(kind: str, request: Request, batch_size: int = ingest.DEFAULT_BATCH_SIZE,
+                      current_user: schemas.UserOut = Depends(get_current_user)):
+    """
+    Bulk import events, speakers or sponsors from the request body.
+
+    The body is NDJSON, or CSV with a header row when the Content-Type mentions
+    ``csv``. It is streamed, validated and inserted in batches of
+    ``batch_size`` rows, so uploads of any size use constant memory. The
+    caller must be signed in; the user is resolved before any of the body is
+    read.
+
+    Args:
+        kind (str): ``events``, ``speakers`` or ``sponsors``.
+        current_user (UserOut): The currently authenticated user (automatically injected).
+
+    Returns:
+        dict: Inserted and rejected counts, elapsed time, rows per second and
+        the first validation errors with their line numbers.
+
+    Raises:
+        HTTPException: If the caller is not signed in (401) or the kind is unknown (404).
+    """
+    if kind not in ingest.KINDS:
+        raise HTTPException(status_code=404, detail="Unknown import kind")
+    fmt = ingest.detect_format(request.headers.get("content-type"))
+    records = ingest.read_records(ingest.read_lines(request.stream()), fmt)
+    return await ingest.ingest(kind, records, batch_size=max(batch_size, 1))
+
+
+@router.post("/tickets", dependencies=[ratelimit.rate_limit("buy_ticket")])
 async def buy_ticket(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_write_db),
+    current_user: schemas.UserOut = Depends(get_current_user)
 ):
     """
     Purchase a ticket for a event.
 
-    Creates a new ticket based on the provided event and user details.
+    Reserves a seat and creates a bought ticket at the event's current price in
+    one transaction. The seat is taken with a single conditional UPDATE of the
+    event's ``tickets_sold`` counter, so concurrent buyers can never sell more
+    tickets than the event's capacity. Follow-up work (the receipt) is queued
+    as a ``ticket_purchased`` job in the same transaction, see :mod:`jobs`.
 
     After successful purchase, redirects the user to the 'my-events' page.
+
+    Raises:
+        HTTPException: If the event does not exist (404) or is sold out (409).
     """
     form = await request.form()
     event_id = int(form.get("event_id"))
 
-    new_ticket = models.Ticket(user_id=current_user.id, event_id=event_id)
+    reserved = (await db.execute(
+        update(Event)
+        .where(Event.id == event_id,
+               or_(Event.capacity.is_(None), Event.tickets_sold < Event.capacity))
+        .values(tickets_sold=Event.tickets_sold + 1)
+        .returning(Event.price)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if reserved is None:
+        await db.rollback()
+        if await db.get(Event, event_id) is None:
+            raise HTTPException(status_code=404, detail="event not found")
+        raise HTTPException(status_code=409, detail="Event is sold out")
+
+    new_ticket = models.Ticket(user_id=current_user.id, event_id=event_id, price=reserved.price,
+                               status=models.TicketStatuses.bought)
     db.add(new_ticket)
-    db.commit()
-    db.refresh(new_ticket)
+    await db.flush()
+    await stats.bump(db, event_id, tickets_bought=1)
+    jobs.enqueue(db, "ticket_purchased", {"ticket_id": new_ticket.id})
+    await db.commit()
+    invalidate_event(event_id, "tickets", "event")
+    live.broker.publish(event_id, tickets_sold=1)
 
     # Виконуємо редірект на сторінку "my-events"
-    return RedirectResponse(url="/my-events?message=Ticket+successfully+purchased", status_code=303)
+    return stick_to_primary(RedirectResponse(url="/my-events?message=Ticket+successfully+purchased", status_code=303))
+
+
+@router.post("/tickets/{ticket_id}/return")
+async def return_ticket(
+    ticket_id: int,
+    db: AsyncSession = Depends(get_write_db),
+    current_user: schemas.UserOut = Depends(get_current_user)
+):
+    """
+    Return a bought ticket and release its seat.
+
+    Only the ticket's owner can return it, and only while it is ``bought``; the
+    status check is part of the UPDATE, so a ticket cannot be returned twice.
+
+    Raises:
+        HTTPException: If the user has no returnable ticket with this ID.
+    """
+    returned = (await db.execute(
+        update(models.Ticket)
+        .where(models.Ticket.id == ticket_id,
+               models.Ticket.user_id == current_user.id,
+               models.Ticket.status == models.TicketStatuses.bought)
+        .values(status=models.TicketStatuses.returned)
+        .returning(models.Ticket.event_id)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if returned is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    await db.execute(
+        update(Event)
+        .where(Event.id == returned.event_id)
+        .values(tickets_sold=Event.tickets_sold - 1)
+        .execution_options(synchronize_session=False)
+    )
+    await stats.bump(db, returned.event_id, tickets_bought=-1, tickets_returned=1)
+    await db.commit()
+    invalidate_event(returned.event_id, "tickets", "event")
+    live.broker.publish(returned.event_id, tickets_sold=-1)
+
+    return stick_to_primary(RedirectResponse(url="/my-events?message=Ticket+returned", status_code=303))
 
 
 @router.get("/events/{event_id}/tickets", response_model=list[schemas.TicketOut])
-def get_tickets_for_event(event_id: int, db: Session = Depends(get_db)):
+async def get_tickets_for_event(event_id: int, request: Request,
+                                stream: Optional[streaming.StreamFormat] = None,
+                                db: AsyncSession = Depends(get_read_db),
+                                sessions=Depends(get_read_sessions)):
     """
     Get all tickets for a specific event.
 
-    Retrieves all purchased tickets for the specified event ID.
+    Retrieves all purchased tickets for the specified event ID. With
+    ``stream=ndjson`` or ``stream=json`` the tickets are streamed from the
+    database in batches instead of being loaded and cached as one list.
 
     Returns:
         List[TicketOut]: A list of ticket objects.
     """
-    
-    return db.query(models.Ticket).filter(models.Ticket.event_id == event_id).all()
+    if stream:
+        stmt = (serialization.select_fields(models.Ticket, schemas.TicketOut)
+                .where(models.Ticket.event_id == event_id).order_by(models.Ticket.id))
+        return streaming.stream_rows(sessions, stmt, schemas.TicketOut, stream)
+
+    return await event_listing(request, db, "tickets", event_id, models.Ticket, schemas.TicketOut)
+
+
+@router.get("/events/{event_id}/live")
+async def follow_event(event_id: int, db: AsyncSession = Depends(get_read_db)):
+    """
+    Stream the changes of an event as server-sent events.
+
+    Each ``change`` event carries the seats sold (``tickets_sold``) and
+    favorites added since the previous one, as deltas, and the feedback
+    submitted in between. Changes are coalesced, see :mod:`live`.
+
+    Raises:
+        HTTPException: If the event does not exist (404), or too many streams
+        are open (503).
+    """
+    if await load_event(db, event_id) is None:
+        raise HTTPException(404, detail="Event not found")
+    return live.stream_response([event_id])
+
+
+@router.get("/events/{event_id}/stats", response_model=schemas.EventStatsOut)
+async def get_event_stats(event_id: int, db: AsyncSession = Depends(get_read_db)):
+    """
+    Retrieve the aggregate counters of an event.
+
+    Ticket counts by status, favorite count and average rating are maintained
+    by the write endpoints, so this is a single primary key lookup.
+
+    Raises:
+        HTTPException: If the event with the specified ID is not found.
+    """
+    row = await db.get(models.EventStats, event_id)
+    if row is None and await db.get(Event, event_id) is None:
+        raise HTTPException(404, detail="Event not found")
+    return stats.to_schema(event_id, row)
 
 
 @router.post("/feedbacks", response_model=schemas.FeedbackOut)
-def add_feedback(feedback: schemas.FeedbackCreate, db: Session = Depends(get_db)):
+async def add_feedback(feedback: schemas.FeedbackCreate, db: AsyncSession = Depends(get_write_db)):
     """
     Submit feedback for a event.
 
@@ -114,26 +358,42 @@ def add_feedback(feedback: schemas.FeedbackCreate, db: Session = Depends(get_db)
     """
     new_feedback = models.Feedback(**feedback.dict())
     db.add(new_feedback)
-    db.commit()
-    db.refresh(new_feedback)
+    await db.execute(httpcache.touch_events(feedback.event_id))
+    if feedback.rating is not None:
+        await stats.bump(db, feedback.event_id, rating_sum=feedback.rating, rating_count=1)
+    await db.commit()
+    await db.refresh(new_feedback)
+    invalidate_event(new_feedback.event_id, "feedbacks", "event")
+    live.broker.publish(new_feedback.event_id,
+                        feedback=schemas.FeedbackOut.model_validate(new_feedback).model_dump(mode="json"))
     return new_feedback
 
 
 @router.get("/events/{event_id}/feedbacks", response_model=list[schemas.FeedbackOut])
-def get_feedbacks_for_event(event_id: int, db: Session = Depends(get_db)):
+async def get_feedbacks_for_event(event_id: int, request: Request,
+                                  stream: Optional[streaming.StreamFormat] = None,
+                                  db: AsyncSession = Depends(get_read_db),
+                                  sessions=Depends(get_read_sessions)):
     """
     Retrieve feedbacks for a specific event.
 
-    Returns all user feedback entries related to the given event.
+    Returns all user feedback entries related to the given event. With
+    ``stream=ndjson`` or ``stream=json`` they are streamed from the database
+    in batches instead of being loaded and cached as one list.
 
     Returns:
         List[FeedbackOut]: A list of feedback objects.
     """
-    return db.query(models.Feedback).filter(models.Feedback.event_id == event_id).all()
+    if stream:
+        stmt = (serialization.select_fields(models.Feedback, schemas.FeedbackOut)
+                .where(models.Feedback.event_id == event_id).order_by(models.Feedback.id))
+        return streaming.stream_rows(sessions, stmt, schemas.FeedbackOut, stream)
+
+    return await event_listing(request, db, "feedbacks", event_id, models.Feedback, schemas.FeedbackOut)
 
 
 @router.post("/sponsors", response_model=schemas.SponsorOut)
-def add_sponsor(sponsor: schemas.SponsorCreate, db: Session = Depends(get_db)):
+async def add_sponsor(sponsor: schemas.SponsorCreate, db: AsyncSession = Depends(get_write_db)):
     """
     Register a new sponsor.
 
@@ -144,13 +404,15 @@ def add_sponsor(sponsor: schemas.SponsorCreate, db: Session = Depends(get_db)):
     """
     new_sponsor = models.Sponsor(**sponsor.dict())
     db.add(new_sponsor)
-    db.commit()
-    db.refresh(new_sponsor)
+    await db.execute(httpcache.touch_events(sponsor.event_id))
+    await db.commit()
+    await db.refresh(new_sponsor)
+    invalidate_event(new_sponsor.event_id, "sponsors", "event")
     return new_sponsor
 
 
 @router.get("/events/{event_id}/sponsors", response_model=list[schemas.SponsorOut])
-def get_sponsors(event_id: int, db: Session = Depends(get_db)):
+async def get_sponsors(event_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve sponsors for a specific event.
 
@@ -162,11 +424,11 @@ def get_sponsors(event_id: int, db: Session = Depends(get_db)):
     Returns:
         List[SponsorOut]: A list of sponsor objects related to the event.
     """
-    return db.query(models.Sponsor).filter(models.Sponsor.event_id == event_id).all()
+    return await event_listing(request, db, "sponsors", event_id, models.Sponsor, schemas.SponsorOut)
 
 
 @router.post("/speakers", response_model=schemas.SpeakerOut)
-def add_speaker(speaker: schemas.SpeakerCreate, db: Session = Depends(get_db)):
+async def add_speaker(speaker: schemas.SpeakerCreate, db: AsyncSession = Depends(get_write_db)):
     """
     Add a new speaker.
 
@@ -180,13 +442,15 @@ def add_speaker(speaker: schemas.SpeakerCreate, db: Session = Depends(get_db)):
     """
     new_speaker = models.Speaker(**speaker.dict())
     db.add(new_speaker)
-    db.commit()
-    db.refresh(new_speaker)
+    await db.execute(httpcache.touch_events(speaker.event_id))
+    await db.commit()
+    await db.refresh(new_speaker)
+    invalidate_event(new_speaker.event_id, "speakers", "event")
     return new_speaker
 
 
 @router.get("/events/{event_id}/speakers", response_model=list[schemas.SpeakerOut])
-def get_speaker(event_id: int, db: Session = Depends(get_db)):
+async def get_speaker(event_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve speakers for a specific event.
 
@@ -198,52 +462,62 @@ def get_speaker(event_id: int, db: Session = Depends(get_db)):
     Returns:
         List[SpeakerOut]: A list of speaker objects.
     """
-    return db.query(models.Speaker).filter(models.Speaker.event_id == event_id).all()
+    return await event_listing(request, db, "speakers", event_id, models.Speaker, schemas.SpeakerOut)
+
+
+@router.get("/stats/cache")
+async def get_cache_stats():
+    """
+    Report the event cache counters.
+
+    Returns:
+        dict: Size, capacity, TTL, hit/miss/eviction/expiration counts and the
+        hit rate of the event cache.
+    """
+    return event_cache.stats()
 
 
-@router.post("/add-to-favorites")
-async def add_to_favorites(request: Request, db: Session = Depends(get_db),
-                           current_user: User = Depends(get_current_user)):
+@router.post("/add-to-favorites", dependencies=[ratelimit.rate_limit("favorites")])
+async def add_to_favorites(request: Request, db: AsyncSession = Depends(get_write_db),
+                           sessions=Depends(get_write_sessions),
+                           current_user: schemas.UserOut = Depends(get_current_user)):
     """
     Add a event to the user's favorites.
 
     Takes the event ID from a submitted form and adds it to the authenticated user's favorites list.
+    Adding an event that is already a favorite changes nothing.
 
     Raises:
-        HTTPException: If the event does not exist or is already in favorites.
+        HTTPException: If the event does not exist.
 
     Returns:
-        dict: A success message indicating the event was added.
+        RedirectResponse: Redirects to the homepage with a message.
     """
-    
-
     form = await request.form()
     event_id = int(form.get('event_id'))
 
-    event = db.query(Event).filter(Event.id == event_id).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="event not found")
-
-    already_favorite = db.query(favourites_table).filter(
-        favourites_table.c.user_id == current_user.id,
-        favourites_table.c.event_id == event_id
-    ).first()
+    if favorites.WRITE_BEHIND:
+        outcome = await favorites.writer.submit(sessions, current_user.id, event_id, True)
+    else:
+        outcome = await favorites.add(db, current_user.id, event_id)
+        await db.commit()
 
-    if already_favorite:
+    if outcome is favorites.Outcome.missing_event:
+        raise HTTPException(status_code=404, detail="event not found")
+    if outcome is favorites.Outcome.unchanged:
         return RedirectResponse(url="/?message=Event+is+already+in+favorites", status_code=303)
-
-    db.execute(favourites_table.insert().values(user_id=current_user.id, event_id=event_id))
-    db.commit()
+    live.broker.publish(event_id, favorites=1)
 
     # Перенаправлення на сторінку з параметром message
     url = "/?message=event+added+to+favorites"
-    return RedirectResponse(url=url, status_code=303)
+    return stick_to_primary(RedirectResponse(url=url, status_code=303))
 
-@router.post("/remove-from-favorites")
+@router.post("/remove-from-favorites", dependencies=[ratelimit.rate_limit("favorites")])
 async def remove_from_favorites(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_write_db),
+    sessions=Depends(get_write_sessions),
+    current_user: schemas.UserOut = Depends(get_current_user)
 ):
     """
     Remove a event from the user's favorites.
@@ -254,8 +528,9 @@ async def remove_from_favorites(
 
     Args:
         request (Request): The HTTP request object containing form data.
-        db (Session): The SQLAlchemy database session.
-        current_user (User): The currently authenticated user (automatically injected).
+        db (AsyncSession): The SQLAlchemy database session.
+        sessions (async_sessionmaker): The primary's session factory, used by the write-behind queue.
+        current_user (UserOut): The currently authenticated user (automatically injected).
 
     Returns:
         RedirectResponse: Redirects the user to the "/my-events" page after successful removal.
@@ -264,13 +539,12 @@ async def remove_from_favorites(
     form = await request.form()
     event_id = int(form.get("event_id"))
 
-    db.execute(
-        favourites_table.delete().where(
-            (favourites_table.c.user_id == current_user.id) &
-            (favourites_table.c.event_id == event_id)
-        )
-    )
-    db.commit()
+    if favorites.WRITE_BEHIND:
+        outcome = await favorites.writer.submit(sessions, current_user.id, event_id, False)
+    else:
+        outcome = await favorites.remove(db, current_user.id, event_id)
+        await db.commit()
+    if outcome is favorites.Outcome.changed:
+        live.broker.publish(event_id, favorites=-1)
     url = "/my-events?message=event+removed+from+favorites"
-    return RedirectResponse(url=url, status_code=303)
-
+    return stick_to_primary(RedirectResponse(url=url, status_code=303))
@@ -0,0 +1,222 @@
+"""
+Adding and removing favorites.
+
+A favorite is added with one ``INSERT ... SELECT ... ON CONFLICT DO NOTHING``
+that only inserts when the event exists. The ``favorites`` primary key makes a
+repeated add a no-op, so concurrent clicks cannot create duplicates. The event
+is looked up separately only when nothing was inserted, to tell a missing event
+from one that is already a favorite.
+
+With ``FAVORITES_WRITE_BEHIND=1`` the endpoints hand their changes to
+:data:`writer` instead. It coalesces the changes that arrive within
+``FAVORITES_FLUSH_MS`` and applies them in one transaction. Each request still
+waits for its batch to commit, so it answers exactly as it would have alone,
+but a burst of clicks costs one commit instead of one per click.
+"""
+import asyncio
+import os
+from dataclasses import dataclass, field
+from enum import Enum
+
+from sqlalchemy import delete, literal, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import stats
+from models import Event, favourites_table
+
+WRITE_BEHIND = os.getenv("FAVORITES_WRITE_BEHIND", "0") == "1"
+FLUSH_SECONDS = float(os.getenv("FAVORITES_FLUSH_MS", "5")) / 1000
+MAX_BATCH = int(os.getenv("FAVORITES_MAX_BATCH", "500"))
+
+_INSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class Outcome(str, Enum):
+    changed = "changed"
+    unchanged = "unchanged"
+    missing_event = "missing_event"
+
+
+async def add(db: AsyncSession, user_id: int, event_id: int) -> Outcome:
+    """
+    Make ``event_id`` a favorite of ``user_id`` and count it, in the caller's transaction.
+    """
+    insert = _INSERT[db.get_bind().dialect.name](favourites_table)
+    stmt = insert.from_select(
+        ["user_id", "event_id"],
+        select(literal(user_id), Event.id).where(Event.id == event_id),
+    ).on_conflict_do_nothing()
+    if (await db.execute(stmt)).rowcount:
+        await stats.bump(db, event_id, favorites=1)
+        return Outcome.changed
+    if await db.scalar(select(Event.id).where(Event.id == event_id)) is None:
+        return Outcome.missing_event
+    return Outcome.unchanged
+
+
+async def remove(db: AsyncSession, user_id: int, event_id: int) -> Outcome:
+    """
+    Remove ``event_id`` from the favorites of ``user_id``, in the caller's transaction.
+    """
+    removed = await db.execute(delete(favourites_table).where(
+        favourites_table.c.user_id == user_id, favourites_table.c.event_id == event_id))
+    if removed.rowcount:
+        await stats.bump(db, event_id, favorites=-removed.rowcount)
+        return Outcome.changed
+    return Outcome.unchanged
+
+
+async def apply(db: AsyncSession, changes: list[tuple[int, int, bool]]) -> list[Outcome]:
+    """
+    Apply ``(user_id, event_id, favorite)`` changes in order and count them, in
+    the caller's transaction.
+
+    The changes are replayed against the current rows in memory, so each gets
+    the outcome it would have had on its own. Only the net difference is
+    written, in one insert and one delete.
+    """
+    keys = {(user_id, event_id) for user_id, event_id, _ in changes}
+    existing = set((await db.execute(select(favourites_table.c.user_id, favourites_table.c.event_id).where(
+        tuple_(favourites_table.c.user_id, favourites_table.c.event_id).in_(keys)))).all())
+    events = set((await db.scalars(select(Event.id).where(
+        Event.id.in_({event_id for _, event_id, _ in changes})))).all())
+
+    state = set(existing)
+    outcomes = []
+    for user_id, event_id, favorite in changes:
+        key = (user_id, event_id)
+        if favorite and event_id not in events:
+            outcomes.append(Outcome.missing_event)
+        elif favorite == (key in state):
+            outcomes.append(Outcome.unchanged)
+        else:
+            (state.add if favorite else state.discard)(key)
+            outcomes.append(Outcome.changed)
+
+    deltas = {}
+    added, removed = state - existing, existing - state
+    if added:
+        insert = _INSERT[db.get_bind().dialect.name](favourites_table)
+        rows = await db.execute(
+            insert.values([{"user_id": user_id, "event_id": event_id} for user_id, event_id in added])
+            .on_conflict_do_nothing()
+            .returning(favourites_table.c.event_id)
+        )
+        for event_id in rows.scalars():
+            deltas[event_id] = deltas.get(event_id, 0) + 1
+    if removed:
+        rows = await db.execute(
+            delete(favourites_table)
+            .where(tuple_(favourites_table.c.user_id, favourites_table.c.event_id).in_(removed))
+            .returning(favourites_table.c.event_id)
+        )
+        for event_id in rows.scalars():
+            deltas[event_id] = deltas.get(event_id, 0) - 1
+    for event_id, delta in sorted(deltas.items()):
+        if delta:
+            await stats.bump(db, event_id, favorites=delta)
+    return outcomes
+
+
+def _fail(futures: list, exc: BaseException):
+    for future in futures:
+        if not future.done():
+            future.set_exception(exc)
+
+
+@dataclass
+class _Batch:
+    changes: list = field(default_factory=list)
+    futures: list = field(default_factory=list)
+
+
+class FavoritesWriter:
+    """
+    Write-behind queue that applies favorite changes in batched transactions.
+
+    Batches are kept per session factory. A batch is flushed ``flush_seconds``
+    after its first change, or as soon as it holds ``max_batch`` changes.
+    Flushes run one at a time, so each batch sees the one before it committed.
+    """
+
+    def __init__(self, flush_seconds: float = FLUSH_SECONDS, max_batch: int = MAX_BATCH):
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self.batches = 0
+        self.changes = 0
+        self._pending = {}
+        self._tasks = set()
+        self._lock = asyncio.Lock()
+
+    async def submit(self, sessions: async_sessionmaker, user_id: int, event_id: int, favorite: bool) -> Outcome:
+        """
+        Queue one change and wait until the batch holding it has committed.
+        """
+        batch = self._pending.get(sessions)
+        if batch is None:
+            batch = self._pending[sessions] = _Batch()
+            self._start(self._flush_later(sessions, batch))
+        future = asyncio.get_running_loop().create_future()
+        batch.changes.append((user_id, event_id, favorite))
+        batch.futures.append(future)
+        if len(batch.changes) >= self.max_batch:
+            self._start(self._flush(sessions, batch))
+        return await future
+
+    def _start(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_later(self, sessions, batch):
+        try:
+            await asyncio.sleep(self.flush_seconds)
+        except asyncio.CancelledError:
+            # Unless a full batch already started flushing, nothing else will flush this one.
+            if self._pending.get(sessions) is batch:
+                del self._pending[sessions]
+                _fail(batch.futures, RuntimeError("Favorites batch was cancelled"))
+            raise
+        await self._flush(sessions, batch)
+
+    async def _flush(self, sessions, batch):
+        if self._pending.get(sessions) is not batch:
+            return  # already flushed
+        del self._pending[sessions]
+        try:
+            async with self._lock, sessions() as db:
+                outcomes = await apply(db, batch.changes)
+                await db.commit()
+            self.batches += 1
+            self.changes += len(batch.changes)
+            for future, outcome in zip(batch.futures, outcomes):
+                if not future.done():
+                    future.set_result(outcome)
+        except Exception as exc:
+            _fail(batch.futures, exc)
+        finally:
+            # Only reached with futures unresolved if the flush was cancelled (e.g. at
+            # shutdown); nothing else would answer the requests waiting on them.
+            _fail(batch.futures, RuntimeError("Favorites batch was cancelled"))
+
+    async def close(self):
+        """
+        Flush whatever is queued and wait for the flushes in progress.
+        """
+        for sessions, batch in list(self._pending.items()):
+            self._start(self._flush(sessions, batch))
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": WRITE_BEHIND,
+            "batches": self.batches,
+            "changes": self.changes,
+            "changes_per_batch": self.changes / self.batches if self.batches else 0.0,
+            "pending": sum(len(batch.changes) for batch in self._pending.values()),
+        }
+
+
+writer = FavoritesWriter()
@@ -0,0 +1,93 @@
+"""
+Conditional GET: strong ETags, Last-Modified and Cache-Control policies.
+
+Validators are derived from the ``updated_at`` version of the rows a response
+is built from. Writes to an event's tickets, feedbacks, sponsors and speakers
+touch the event itself, so the event's version also validates its listings.
+A request whose ``If-None-Match`` (or, without it, ``If-Modified-Since``)
+matches is answered with an empty 304 before the body is built.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import update
+
+import models
+
+MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "60"))
+
+# Shared caches (a CDN) may serve public responses for MAX_AGE seconds;
+# private ones are kept by the browser only and revalidated on every use.
+PUBLIC = f"public, max-age={MAX_AGE}"
+PRIVATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """
+    Build a strong ETag from the values that determine a response body.
+    """
+    return '"' + hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest() + '"'
+
+
+def file_version(path: str) -> int:
+    """
+    Modification time of a file, for validators of responses rendered from it.
+    """
+    return os.stat(path).st_mtime_ns
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime] = None, cache_control: str = PUBLIC) -> dict:
+    """
+    Response headers carrying the validators and the Cache-Control policy.
+
+    ``last_modified`` is a naive UTC datetime, as stored in ``updated_at``.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def is_fresh(request: Request, headers: dict) -> bool:
+    """
+    Whether the client's cached copy matches the validators in ``headers``.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or headers["ETag"] in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or "Last-Modified" not in headers:
+        return False
+    try:
+        return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+def versions(rows) -> tuple:
+    """
+    The ``(id, updated_at)`` pairs of ``rows``, for validators of a list.
+    """
+    return tuple((row.id, row.updated_at) for row in rows)
+
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def touch_events(*event_ids: int):
+    """
+    Statement bumping the version of events whose child rows changed.
+    """
+    return (
+        update(models.Event)
+        .where(models.Event.id.in_(set(event_ids)))
+        .values(updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
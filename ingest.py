@@ -0,0 +1,239 @@
+"""
+Streaming bulk import of events, speakers and sponsors.
+
+Records are read as NDJSON (one JSON object per line) or CSV (with a header
+row), validated against the pydantic ``*Create`` schemas a batch at a time and
+written with executemany inserts, one transaction per batch. Input is consumed
+incrementally, so memory use depends on the batch size, not the file size.
+
+Usage::
+
+    python ingest.py events catalogue.ndjson
+    python ingest.py sponsors sponsors.csv --batch-size 5000
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from typing import AsyncIterator, Optional
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert
+from starlette.concurrency import run_in_threadpool
+
+import database
+import httpcache
+import migrations
+import models
+import schemas
+from cache import invalidate_event
+
+KINDS = {
+    "events": (models.Event, schemas.EventCreate),
+    "speakers": (models.Speaker, schemas.SpeakerCreate),
+    "sponsors": (models.Sponsor, schemas.SponsorCreate),
+}
+FORMATS = ("ndjson", "csv")
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+
+
+class IngestError(ValueError):
+    """Raised for an unknown record kind or input format."""
+
+
+def _decode(line: bytes) -> Optional[str]:
+    try:
+        return line.rstrip(b"\r").decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Optional[str]]:
+    """
+    Split a stream of byte chunks into decoded lines, without line endings.
+
+    Lines that are not valid UTF-8 are yielded as ``None``.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield _decode(line)
+    if buffer:
+        yield _decode(buffer)
+
+
+async def read_records(lines: AsyncIterator[Optional[str]], fmt: str) -> AsyncIterator[tuple[int, dict]]:
+    """
+    Parse lines into ``(line_number, record)`` pairs.
+
+    Quoted CSV fields may span several lines; empty CSV cells become ``None``.
+    Lines that cannot be decoded or parsed are yielded as ``(line_number, None)``.
+    """
+    if fmt not in FORMATS:
+        raise IngestError(f"Unsupported format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+    header = None
+    pending, start = "", 0
+    number = 0
+    async for line in lines:
+        number += 1
+        if line is None:
+            # Inside a quoted CSV field the line belongs to the pending record.
+            yield (start if pending else number), None
+            pending = ""
+            continue
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, record if isinstance(record, dict) else None
+            continue
+
+        if pending:
+            pending += "\n" + line
+        else:
+            pending, start = line, number
+        # An odd number of quotes means a quoted field continues on the next line.
+        if pending.count('"') % 2:
+            continue
+        text, pending = pending, ""
+        if not text.strip():
+            continue
+        row = next(csv.reader([text]))
+        if header is None:
+            header = row
+            continue
+        if len(row) != len(header):
+            yield start, None
+            continue
+        yield start, {key: value if value != "" else None for key, value in zip(header, row)}
+
+    if pending:
+        yield start, None
+
+
+def _validate(adapter: TypeAdapter, batch: list) -> tuple[list[dict], list[dict]]:
+    """
+    Validate a batch of ``(line_number, record)`` pairs.
+
+    Returns:
+        tuple[list[dict], list[dict]]: Column values of the valid records and
+        an error entry for each invalid one.
+    """
+    errors = [{"line": line, "error": "Malformed record"} for line, record in batch if record is None]
+    batch = [(line, record) for line, record in batch if record is not None]
+    try:
+        rows = adapter.validate_python([record for _, record in batch])
+    except ValidationError as exc:
+        bad = {}
+        for error in exc.errors():
+            bad.setdefault(error["loc"][0], f"{'.'.join(map(str, error['loc'][1:]))}: {error['msg']}")
+        errors += [{"line": batch[index][0], "error": message} for index, message in bad.items()]
+        rows = adapter.validate_python([record for index, (_, record) in enumerate(batch) if index not in bad])
+    return [row.model_dump() for row in rows], errors
+
+
+async def ingest(kind: str, records: AsyncIterator[tuple[int, dict]], engine=None,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    """
+    Validate and insert records of one kind in batches.
+
+    Each batch is inserted with a single executemany in its own transaction, so
+    a failure loses at most the batch in flight. Invalid records are skipped and
+    reported; the first ``MAX_REPORTED_ERRORS`` are listed with their line.
+
+    Returns:
+        dict: Inserted and rejected counts, elapsed seconds, rows per second and
+        the reported errors.
+    """
+    if kind not in KINDS:
+        raise IngestError(f"Unknown kind {kind!r}, expected one of {', '.join(KINDS)}")
+    model, schema = KINDS[kind]
+    adapter = TypeAdapter(list[schema])
+    engine = engine or database.async_engine
+
+    inserted = rejected = 0
+    errors = []
+    started = time.perf_counter()
+
+    async def flush(batch):
+        nonlocal inserted, rejected
+        rows, batch_errors = await run_in_threadpool(_validate, adapter, batch)
+        rejected += len(batch_errors)
+        errors.extend(batch_errors[:MAX_REPORTED_ERRORS - len(errors)])
+        if rows:
+            event_ids = {row["event_id"] for row in rows} if kind != "events" else set()
+            async with engine.begin() as conn:
+                await conn.execute(insert(model), rows)
+                if event_ids:
+                    await conn.execute(httpcache.touch_events(*event_ids))
+            inserted += len(rows)
+            for event_id in event_ids:
+                invalidate_event(event_id, kind, "event")
+
+    batch = []
+    async for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "kind": kind,
+        "inserted": inserted,
+        "rejected": rejected,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(inserted / elapsed, 1) if elapsed else 0.0,
+        "errors": errors,
+    }
+
+
+def detect_format(content_type: Optional[str]) -> str:
+    """
+    Map a request Content-Type to an input format; anything but CSV is NDJSON.
+    """
+    return "csv" if content_type and "csv" in content_type else "ndjson"
+
+
+async def _read_file(file, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    while chunk := file.read(chunk_size):
+        yield chunk
+
+
+async def _main(args):
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(migrations.migrate)
+    file = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    try:
+        fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+        records = read_records(read_lines(_read_file(file)), fmt)
+        return await ingest(args.kind, records, batch_size=args.batch_size)
+    finally:
+        if file is not sys.stdin.buffer:
+            file.close()
+        await database.async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import events, speakers or sponsors.")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("path", help="NDJSON or CSV file, or - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to csv for *.csv, ndjson otherwise")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    report = asyncio.run(_main(parser.parse_args()))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Durable background jobs kept in the ``jobs`` table.
+
+Request handlers :func:`enqueue` work inside their own transaction, so a job
+exists exactly when the change that asked for it was committed, and return
+without waiting for it. A :class:`Worker` (usually a separate process) claims
+due jobs, runs the handler registered for their kind and deletes them once
+the handler's transaction has committed::
+
+    python jobs.py                  # run a worker until interrupted
+    python jobs.py --burst          # run until the queue is empty
+    python jobs.py --status         # queue depth and dead jobs
+    python jobs.py --retry-dead     # queue dead jobs again
+
+Claiming a job sets it ``running`` and moves its ``run_at`` to the end of a
+lease. If the worker dies, the lease runs out and another worker takes the
+job over, so a job runs at least once and handlers must tolerate a repeat.
+A failed job is retried with exponential backoff; after ``max_attempts`` it
+is left ``dead`` with its last error for an operator to inspect.
+
+Set ``JOBS_WORKER_IN_APP=1`` to run a worker inside the web process instead,
+for deployments without a separate one.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import traceback
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database
+import migrations
+import models
+from templating import templates
+from models import Job, JobStatus
+
+MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("JOBS_RETRY_BASE_SECONDS", "2"))
+RETRY_MAX_SECONDS = float(os.getenv("JOBS_RETRY_MAX_SECONDS", "600"))
+TIMEOUT_SECONDS = float(os.getenv("JOBS_TIMEOUT_SECONDS", "60"))
+POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "0.5"))
+CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "8"))
+WORKER_IN_APP = os.getenv("JOBS_WORKER_IN_APP", "0") == "1"
+
+log = logging.getLogger("jobs")
+
+Handler = Callable[[AsyncSession, dict], Awaitable[None]]
+HANDLERS: dict[str, Handler] = {}
+
+
+def handler(kind: str):
+    """
+    Register the decorated ``async handle(db, payload)`` for jobs of ``kind``.
+
+    The handler runs in its own session; the worker commits it together with
+    the deletion of the job.
+    """
+    def register(handle):
+        HANDLERS[kind] = handle
+        return handle
+    return register
+
+
+def enqueue(db: AsyncSession, kind: str, payload: dict, delay_seconds: float = 0,
+            max_attempts: int = MAX_ATTEMPTS) -> Job:
+    """
+    Add a job to the caller's transaction; it is queued when the caller commits.
+    """
+    job = Job(kind=kind, payload=payload, max_attempts=max_attempts,
+              run_at=datetime.utcnow() + timedelta(seconds=delay_seconds))
+    db.add(job)
+    return job
+
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+async def claim(db: AsyncSession, limit: int, lease_seconds: float) -> list:
+    """
+    Take up to ``limit`` due jobs, including running ones whose lease expired,
+    and commit the claim.
+    """
+    now = datetime.utcnow()
+    due = (select(Job.id)
+           .where(Job.status.in_([JobStatus.queued, JobStatus.running]), Job.run_at <= now)
+           .order_by(Job.run_at, Job.id)
+           .limit(limit)
+           .with_for_update(skip_locked=True))
+    rows = (await db.execute(
+        update(Job)
+        .where(Job.id.in_(due.scalar_subquery()))
+        .values(status=JobStatus.running, attempts=Job.attempts + 1,
+                run_at=now + timedelta(seconds=lease_seconds))
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+        .execution_options(synchronize_session=False)
+    )).all()
+    await db.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+class Worker:
+    """
+    Claims due jobs in batches and runs up to ``concurrency`` of them at a time.
+    """
+
+    def __init__(self, sessions: async_sessionmaker = None, concurrency: int = CONCURRENCY,
+                 timeout_seconds: float = TIMEOUT_SECONDS, poll_seconds: float = POLL_SECONDS):
+        self.sessions = sessions or database.get_write_sessions()
+        self.concurrency = concurrency
+        self.timeout_seconds = timeout_seconds
+        self.poll_seconds = poll_seconds
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+        self._task = None
+
+    async def run(self, burst: bool = False):
+        """
+        Process jobs until cancelled or, with ``burst``, until none are due.
+        """
+        # A claimed job must finish well before its lease lets another worker take it.
+        lease_seconds = self.timeout_seconds * 2
+        while True:
+            try:
+                async with self.sessions() as db:
+                    batch = await claim(db, self.concurrency, lease_seconds)
+            except Exception:
+                log.exception("claiming jobs failed")
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            if batch:
+                await asyncio.gather(*(self._run_one(job) for job in batch))
+            elif burst:
+                return
+            else:
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _run_one(self, job):
+        handle = HANDLERS.get(job.kind)
+        try:
+            if handle is None:
+                raise LookupError(f"no handler for job kind {job.kind!r}")
+            async with self.sessions() as db:
+                await asyncio.wait_for(handle(db, job.payload), self.timeout_seconds)
+                await db.execute(delete(Job).where(Job.id == job.id))
+                await db.commit()
+            self.completed += 1
+        except Exception as exc:
+            try:
+                await self._fail(job, exc, retry=handle is not None)
+            except Exception:
+                # The job stays claimed and is taken over when its lease runs out.
+                log.exception("recording the failure of job %s failed", job.id)
+
+    async def _fail(self, job, exc: Exception, retry: bool):
+        error = "".join(traceback.format_exception_only(exc)).strip()
+        values = {"last_error": error}
+        if retry and job.attempts < job.max_attempts:
+            values.update(status=JobStatus.queued,
+                          run_at=datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts)))
+            self.retried += 1
+            log.warning("job %s (%s) failed on attempt %d, retrying: %s", job.id, job.kind, job.attempts, error)
+        else:
+            values.update(status=JobStatus.dead)
+            self.dead += 1
+            log.error("job %s (%s) is dead after %d attempts: %s", job.id, job.kind, job.attempts, error)
+        async with self.sessions() as db:
+            await db.execute(update(Job).where(Job.id == job.id).values(**values))
+            await db.commit()
+
+    def start(self):
+        """
+        Run in the background of the current event loop (see ``JOBS_WORKER_IN_APP``).
+        """
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"completed": self.completed, "retried": self.retried, "dead": self.dead}
+
+
+def queue_stats(engine=None) -> dict:
+    """
+    Count the jobs per status and give the age of the oldest due queued job.
+
+    Sync, for the metrics scrape and the command line.
+    """
+    now = datetime.utcnow()
+    with (engine or database.engine).connect() as conn:
+        counts = dict(conn.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+        oldest = conn.scalar(select(func.min(Job.run_at)).where(Job.status == JobStatus.queued, Job.run_at <= now))
+    return {
+        **{status.value: counts.get(status, 0) for status in JobStatus},
+        "oldest_due_seconds": (now - oldest).total_seconds() if oldest else 0.0,
+    }
+
+
+# Post-purchase work.
+
+receipt_log = logging.getLogger("jobs.receipts")
+
+
+@handler("ticket_purchased")
+async def send_receipt(db: AsyncSession, payload: dict):
+    """
+    Render the receipt of a bought ticket and hand it to the ``jobs.receipts`` logger.
+    """
+    ticket = await db.get(models.Ticket, payload["ticket_id"])
+    if ticket is None:
+        return
+    event = await db.get(models.Event, ticket.event_id)
+    user = await db.get(models.User, ticket.user_id)
+    body = templates.get_template("partials/ticket_receipt.txt").render(ticket=ticket, event=event, user=user)
+    receipt_log.info("receipt for ticket %s to %s\n%s", ticket.id, user.email or user.username, body)
+
+
+async def _dead_jobs():
+    async with database.AsyncSessionlocal() as db:
+        return (await db.execute(
+            select(Job.id, Job.kind, Job.attempts, Job.last_error).where(Job.status == JobStatus.dead).order_by(Job.id)
+        )).all()
+
+
+async def _main(args):
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(migrations.migrate)
+    try:
+        if args.status:
+            for name, value in queue_stats().items():
+                print(f"{name:<20} {value}")
+            for job in await _dead_jobs():
+                print(f"dead job {job.id} ({job.kind}) after {job.attempts} attempts: {job.last_error}")
+        elif args.retry_dead:
+            async with database.AsyncSessionlocal() as db:
+                stmt = update(Job).where(Job.status == JobStatus.dead)
+                if args.kind:
+                    stmt = stmt.where(Job.kind == args.kind)
+                result = await db.execute(stmt.values(status=JobStatus.queued, attempts=0, run_at=datetime.utcnow()))
+                await db.commit()
+            print(f"queued {result.rowcount} dead jobs again")
+        else:
+            worker = Worker(concurrency=args.concurrency)
+            try:
+                await worker.run(burst=args.burst)
+            finally:
+                print(worker.stats())
+    finally:
+        await database.dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run or inspect the background job queue.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="jobs run at the same time")
+    parser.add_argument("--burst", action="store_true", help="exit once no job is due")
+    parser.add_argument("--status", action="store_true", help="show the queue depth and dead jobs")
+    parser.add_argument("--retry-dead", action="store_true", help="queue dead jobs again")
+    parser.add_argument("--kind", help="with --retry-dead, only jobs of this kind")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
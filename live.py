@@ -0,0 +1,236 @@
+"""
+Live event updates over server-sent events.
+
+The write endpoints :meth:`Broker.publish` what they changed once their
+transaction has committed: seats sold or returned, favorites added or
+removed, and new feedback. Streams opened with :func:`stream_response`
+receive those changes for the events they follow.
+
+Messages carry changes, not totals: ``{"event_id": 1, "tickets_sold": 2,
+"favorites": -1, "feedbacks": [...]}``. A client applies them to the counts
+it rendered or fetched from ``/events/{id}/stats``, and fetches them again
+when it reconnects.
+
+Changes are coalesced per event: the broker merges what is published within
+``COALESCE_SECONDS`` (counters summed, at most ``MAX_FEEDBACKS`` feedbacks
+kept, the rest counted in ``more_feedbacks``), encodes the merged message
+once and hands the same bytes to every follower. The cost of a busy event is
+therefore one message per follower per interval, however many writes it
+gets. Idle streams cost no timer of their own: a single broker timer sends
+the heartbeats that keep proxies from closing them.
+
+Publishing never waits for a stream. A stream whose client reads too slowly
+buffers its messages up to ``MAX_BUFFERED_BYTES`` and is then closed, and
+the client reconnects (after ``RETRY_MS``) with fresh totals.
+
+The broker is in-process: with several worker processes, each one streams
+the changes its own requests made. uvicorn waits for open responses before
+it shuts down, so run it with ``--timeout-graceful-shutdown`` to cut the
+streams off; browsers reconnect on their own.
+"""
+import asyncio
+import os
+from collections import defaultdict
+from typing import AsyncIterator, Iterable
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+
+COALESCE_SECONDS = float(os.getenv("LIVE_COALESCE_MS", "1000")) / 1000
+HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "50000"))
+MAX_EVENTS_PER_STREAM = int(os.getenv("LIVE_MAX_EVENTS_PER_STREAM", "100"))
+MAX_BUFFERED_BYTES = int(os.getenv("LIVE_MAX_BUFFERED_BYTES", str(256 * 1024)))
+MAX_FEEDBACKS = 20
+# Sent first: how long a browser's EventSource waits before reconnecting.
+RETRY_MS = 5000
+
+COUNTERS = ("tickets_sold", "favorites")
+KEEP_ALIVE = b": keep-alive\n\n"
+
+
+class Subscription:
+    """
+    One stream: the events it follows and the encoded messages not sent yet.
+    """
+    __slots__ = ("event_ids", "outbox", "buffered", "ready", "closed", "active")
+
+    def __init__(self, event_ids: frozenset):
+        self.event_ids = event_ids
+        self.outbox = []
+        self.buffered = 0
+        self.ready = asyncio.Event()
+        self.closed = False
+        # Whether anything was queued since the last heartbeat.
+        self.active = False
+
+    def push(self, data: bytes) -> bool:
+        """
+        Queue ``data``; return ``False`` if the client is too far behind to take it.
+        """
+        if self.buffered + len(data) > MAX_BUFFERED_BYTES:
+            return False
+        self.outbox.append(data)
+        self.buffered += len(data)
+        self.active = True
+        self.ready.set()
+        return True
+
+    def take(self) -> bytes:
+        data = b"".join(self.outbox)
+        self.outbox.clear()
+        self.buffered = 0
+        self.ready.clear()
+        return data
+
+
+class Broker:
+    """
+    Fan-out of event changes to the subscriptions following each event.
+
+    :meth:`subscribe`, :meth:`unsubscribe` and :meth:`publish` update
+    ``topics`` and ``pending`` without awaiting anything in between, so a
+    change is never delivered to a half-registered subscription.
+    """
+
+    def __init__(self, max_subscribers: int = MAX_SUBSCRIBERS, coalesce_seconds: float = COALESCE_SECONDS,
+                 heartbeat_seconds: float = HEARTBEAT_SECONDS):
+        self.max_subscribers = max_subscribers
+        self.coalesce_seconds = coalesce_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.subscriptions = set()
+        self.topics = defaultdict(set)
+        self.pending = {}
+        self._flush_timer = None
+        self._heartbeat_timer = None
+        self.published = 0
+        self.messages = 0
+        self.delivered = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    def full(self) -> bool:
+        return len(self.subscriptions) >= self.max_subscribers
+
+    def subscribe(self, event_ids: Iterable[int]) -> Subscription:
+        subscription = Subscription(frozenset(event_ids))
+        self.subscriptions.add(subscription)
+        for event_id in subscription.event_ids:
+            self.topics[event_id].add(subscription)
+        if self._heartbeat_timer is None:
+            self._heartbeat_timer = asyncio.get_running_loop().call_later(self.heartbeat_seconds, self._heartbeat)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription.closed:
+            return
+        subscription.closed = True
+        subscription.ready.set()
+        self.subscriptions.discard(subscription)
+        for event_id in subscription.event_ids:
+            followers = self.topics.get(event_id)
+            if followers is not None:
+                followers.discard(subscription)
+                if not followers:
+                    del self.topics[event_id]
+
+    def publish(self, event_id: int, feedback: dict = None, **counters: int):
+        """
+        Queue a committed change of ``event_id`` (e.g. ``tickets_sold=1``, or a
+        new ``feedback``) for its followers.
+        """
+        unknown = set(counters) - set(COUNTERS)
+        if unknown:
+            raise ValueError(f"Unknown counters: {', '.join(sorted(unknown))}")
+        self.published += 1
+        if event_id not in self.topics:
+            return
+        change = self.pending.setdefault(event_id, {"event_id": event_id})
+        for name, delta in counters.items():
+            change[name] = change.get(name, 0) + delta
+        if feedback is not None:
+            feedbacks = change.setdefault("feedbacks", [])
+            if len(feedbacks) < MAX_FEEDBACKS:
+                feedbacks.append(feedback)
+            else:
+                change["more_feedbacks"] = change.get("more_feedbacks", 0) + 1
+        if self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(self.coalesce_seconds, self._flush)
+
+    def _flush(self):
+        self._flush_timer = None
+        pending, self.pending = self.pending, {}
+        for event_id, change in pending.items():
+            for name in COUNTERS:
+                if change.get(name) == 0:
+                    del change[name]  # cancelled out
+            if len(change) == 1:
+                continue
+            self.messages += 1
+            self._send(self.topics.get(event_id, ()), b"event: change\ndata: " + to_json(change) + b"\n\n")
+
+    def _heartbeat(self):
+        self._heartbeat_timer = None
+        idle = [subscription for subscription in self.subscriptions if not subscription.active]
+        for subscription in self.subscriptions:
+            subscription.active = False
+        self._send(idle, KEEP_ALIVE)
+        if self.subscriptions:
+            self._heartbeat_timer = asyncio.get_running_loop().call_later(self.heartbeat_seconds, self._heartbeat)
+
+    def _send(self, subscriptions, data: bytes):
+        for subscription in list(subscriptions):
+            if subscription.push(data):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+                self.unsubscribe(subscription)
+
+    async def stream(self, event_ids: Iterable[int]) -> AsyncIterator[bytes]:
+        """
+        Follow ``event_ids`` and yield their changes as server-sent events.
+
+        The subscription is made when the stream starts and dropped when it
+        ends, so a client that leaves before the body is sent leaves nothing
+        behind.
+        """
+        subscription = self.subscribe(event_ids)
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            while not subscription.closed:
+                await subscription.ready.wait()
+                data = subscription.take()
+                if data:
+                    yield data
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscriptions),
+            "events_followed": len(self.topics),
+            "published": self.published,
+            "messages": self.messages,
+            "delivered": self.delivered,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+        }
+
+
+broker = Broker()
+
+
+def stream_response(event_ids: Iterable[int]) -> StreamingResponse:
+    """
+    Respond with a server-sent event stream of the changes to ``event_ids``.
+
+    Raises:
+        HTTPException: If the broker already holds its maximum number of streams (503).
+    """
+    if broker.full():
+        broker.rejected += 1
+        raise HTTPException(status_code=503, detail="Too many live streams",
+                            headers={"Retry-After": str(RETRY_MS // 1000)})
+    return StreamingResponse(broker.stream(event_ids), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
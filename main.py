@@ -1,62 +1,204 @@
-from fastapi import FastAPI, HTTPException, Depends, Response
+"""
+The application: :func:`create_app` builds it, and ``app`` is the one
+``uvicorn main:app`` serves.
+
+Importing this module opens nothing. The engines are built, the schema
+migrated and the job worker started by the app's lifespan when the server
+starts, and undone when it stops. Templates are compiled on their first
+render, through the bytecode cache of :mod:`templating`.
+
+Set ``MIGRATE_ON_STARTUP=0`` when migrations run as a release step
+(``python migrations.py``) rather than in every worker.
+"""
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, FastAPI, Depends, Response
 from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from models import get_db, Base, engine
-from sqlalchemy.orm import Session
+from database import get_read_db
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth import router as auth_router, get_current_user, optional_current_user
 from event_routes import router as event_router
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from pagination import event_page_params, fetch_event_page
+from passwords import password_hasher
+from cache import event_cache, fragment_cache, token_cache, user_cache
+from markupsafe import Markup
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.requests import Request
-from models import User
+from templating import STATIC_VERSION, templates
+import assets
+import database
+import favorites
+import httpcache
+import jobs
+import live
+import metrics
+import migrations
+import ratelimit
+import schemas
 import models
 
-app = FastAPI()
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
+router = APIRouter()
+
 
-templates = Jinja2Templates(directory="static")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    database.create_engines()
+    if MIGRATE_ON_STARTUP:
+        try:
+            async with database.async_engine.begin() as conn:
+                await conn.run_sync(migrations.migrate)
+        except BaseException:
+            # Let the worker exit with the error rather than hang on the engines' threads.
+            await database.dispose_engines()
+            raise
+    job_worker = None
+    if jobs.WORKER_IN_APP:
+        job_worker = jobs.Worker()
+        metrics.registry.add_collector("job_worker", job_worker.stats)
+        job_worker.start()
+    try:
+        yield
+    finally:
+        if job_worker is not None:
+            await job_worker.stop()
+        await favorites.writer.close()
+        password_hasher.shutdown()
+        # aiosqlite connections each own a non-daemon thread; close them or the process cannot exit.
+        await database.dispose_engines()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-Base.metadata.create_all(bind=engine)
+def create_app() -> FastAPI:
+    """
+    Build the application; ``uvicorn --factory main:create_app`` serves a fresh one.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Outermost, so the latency covers the whole stack.
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.registry.add_collector("event_cache", event_cache.stats)
+    metrics.registry.add_collector("user_cache", user_cache.stats)
+    metrics.registry.add_collector("token_cache", token_cache.stats)
+    metrics.registry.add_collector("fragment_cache", fragment_cache.stats)
+    metrics.registry.add_collector("password_hashing", password_hasher.stats)
+    metrics.registry.add_collector("favorites_writer", favorites.writer.stats)
+    metrics.registry.add_collector("live", live.broker.stats)
+    metrics.registry.add_collector("jobs", jobs.queue_stats)
+    metrics.registry.add_collector("rate_limit", ratelimit.limiter.stats)
 
-app.include_router(auth_router)
-app.include_router(event_router)
+    app.include_router(auth_router)
+    app.include_router(event_router)
+    app.include_router(router)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+    app.mount("/static", assets.PrecompressedStaticFiles(directory="static"), name="static")
+    return app
 
 
-@app.get("/logout")
+@router.get("/logout")
 def logout(response: Response):
     response = RedirectResponse(url="/", status_code=302)
     response.delete_cookie("access_token")
     return response
 
 
-@app.get("/", response_class=HTMLResponse)
-def homepage(request: Request, db: Session = Depends(get_db), user: User = Depends(optional_current_user)):
-    events = db.query(models.Event).all()
+# Event cards list sponsor names: one extra IN query per page instead of one per card.
+EVENT_CARD_LOADING = (selectinload(models.Event.sponsors),)
+EVENT_CARDS_TEMPLATE = "partials/event_cards.html"
+
+
+def event_cards_version(events) -> str:
+    """
+    Identify the rendered cards of ``events``.
+
+    Sponsor changes touch their event, so the event versions and the partial's
+    own version determine the HTML.
+    """
+    return httpcache.make_etag("event_cards", httpcache.versions(events),
+                               httpcache.file_version(f"static/{EVENT_CARDS_TEMPLATE}"))
+
+
+def render_event_cards(version: str, events) -> Markup:
+    """
+    Render the event cards, reusing the cached fragment of this version.
+    """
+    return Markup(fragment_cache.get_or_render(
+        version, lambda: templates.get_template(EVENT_CARDS_TEMPLATE).render(events=events)))
+
+
+@router.get("/", response_class=HTMLResponse)
+async def homepage(request: Request, db: AsyncSession = Depends(get_read_db), user: schemas.UserOut = Depends(optional_current_user),
+                   page: dict = Depends(event_page_params)):
+    events, next_cursor = await fetch_event_page(db, options=EVENT_CARD_LOADING, **page)
     message = request.query_params.get("message")
-    
+    next_url = request.url.include_query_params(cursor=next_cursor) if next_cursor else None
+
+    cards_version = event_cards_version(events)
+    headers = httpcache.cache_headers(
+        httpcache.make_etag("home", user, message, cards_version, next_cursor,
+                            httpcache.file_version("static/main_page.html"), STATIC_VERSION),
+        cache_control=httpcache.PRIVATE,
+    )
+    if httpcache.is_fresh(request, headers):
+        return httpcache.not_modified(headers)
+
     context = {
         "request": request,
-        "events": events,
+        "event_cards": render_event_cards(cards_version, events),
+        "next_url": next_url,
         "user": user,
         "message": message
     }
-    return templates.TemplateResponse("main_page.html", context)
+    return templates.TemplateResponse("main_page.html", context, headers=headers)
+
 
+@router.get("/stats/fragments")
+def get_fragment_stats():
+    """
+    Report the rendered fragment cache counters.
 
-@app.get("/my-events", response_class=HTMLResponse)
-def my_events(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    favorite_events = current_user.favorites  # Завдяки relationship, не треба вручну SQL
+    Returns:
+        dict: Entries, size and capacity in bytes, hit/miss/eviction counts,
+        the hit rate and the time spent rendering on misses.
+    """
+    return fragment_cache.stats()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    """
+    Export the request, SQL, template and bcrypt timings per route, and the
+    cache and hashing pool counters, in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/my-events", response_class=HTMLResponse)
+async def my_events(request: Request, db: AsyncSession = Depends(get_read_db), current_user: schemas.UserOut = Depends(get_current_user)):
+    # A single join instead of walking the lazy User.favorites relationship.
+    favorite_events = (await db.scalars(
+        select(models.Event)
+        .join(models.favourites_table, models.favourites_table.c.event_id == models.Event.id)
+        .where(models.favourites_table.c.user_id == current_user.id)
+    )).all()
     message = request.query_params.get("message")
+    headers = httpcache.cache_headers(
+        httpcache.make_etag("my-events", current_user, message, httpcache.versions(favorite_events),
+                            httpcache.file_version("static/mojeeventy.html"), STATIC_VERSION),
+        cache_control=httpcache.PRIVATE,
+    )
+    if httpcache.is_fresh(request, headers):
+        return httpcache.not_modified(headers)
     return templates.TemplateResponse("mojeeventy.html", {
         "request": request,
         "events": favorite_events,
@@ -64,5 +206,7 @@ def my_events(request: Request, db: Session = Depends(get_db), current_user: mod
         "message": message
         
         
-    })
+    }, headers=headers)
+
 
+app = create_app()
@@ -0,0 +1,294 @@
+"""
+Per-request performance metrics, exported in the Prometheus text format.
+
+:class:`MetricsMiddleware` opens a :class:`RequestStats` for every HTTP
+request and publishes it through a context variable. The SQLAlchemy hooks
+installed by :func:`instrument_engine`, the Jinja templates set up by
+:func:`instrument_templates` and the password hasher add to it. When the
+response is sent, the middleware folds it into per-route totals. Routes are
+labelled with their path template (``/events/{event_id}``), so the number
+of series stays bounded.
+
+Recording a request costs a few counter updates and, per statement, one
+``perf_counter`` pair. The statements themselves are only formatted when a
+request is slower than ``SLOW_REQUEST_SECONDS``: it is then logged to the
+``metrics.slow`` logger with its slowest SQL (without parameters).
+"""
+import logging
+import os
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+
+from jinja2 import Template
+from sqlalchemy import event
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+# Statements kept per request for the slow-request log.
+SLOW_LOG_STATEMENTS = int(os.getenv("SLOW_LOG_STATEMENTS", "10"))
+MAX_RECORDED_STATEMENTS = 200
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PREFIX = "eventplanner"
+
+slow_log = logging.getLogger("metrics.slow")
+
+
+class RequestStats:
+    """
+    What one request spent, filled in while it runs.
+    """
+    __slots__ = ("statements", "db_seconds", "template_seconds", "hash_seconds", "queries")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.queries = []
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current() -> Optional[RequestStats]:
+    """
+    The stats of the request being handled, or ``None`` outside a request.
+    """
+    return _current.get()
+
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count of observed values.
+    """
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def samples(self, name: str, labels: str):
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class RouteMetrics:
+    """
+    Totals of the requests served by one route and method.
+    """
+
+    def __init__(self):
+        self.responses = defaultdict(int)
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.hash_seconds = 0.0
+
+    def observe(self, status: int, seconds: float, stats: RequestStats):
+        self.responses[status] += 1
+        self.latency.observe(seconds)
+        self.statements.observe(stats.statements)
+        self.db_seconds += stats.db_seconds
+        self.template_seconds += stats.template_seconds
+        self.hash_seconds += stats.hash_seconds
+
+
+class Registry:
+    """
+    Per-route metrics plus gauges collected at scrape time.
+    """
+
+    def __init__(self):
+        self.routes = defaultdict(RouteMetrics)
+        self.collectors = {}
+
+    def add_collector(self, name: str, collect):
+        """
+        Export the numeric values of the dict ``collect()`` returns (nested
+        dicts flattened) as gauges named ``<PREFIX>_<name>_<key>``.
+        """
+        self.collectors[name] = collect
+
+    def render(self) -> str:
+        routes = sorted(self.routes.items())
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        family("http_requests_total", "counter", "Responses by route, method and status.")
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.responses.items()):
+                lines.append(f'{PREFIX}_http_requests_total{{method="{method}",route="{route}",status="{status}"}} '
+                             f"{count}")
+        for name, attribute, help_text in (
+                ("http_request_duration_seconds", "latency", "Request latency."),
+                ("db_statements_per_request", "statements", "SQL statements executed per request.")):
+            family(name, "histogram", help_text)
+            for (method, route), metrics in routes:
+                lines.extend(getattr(metrics, attribute).samples(
+                    f"{PREFIX}_{name}", f'method="{method}",route="{route}"'))
+        for name, attribute, help_text in (
+                ("db_seconds_total", "db_seconds", "Time spent executing SQL."),
+                ("template_render_seconds_total", "template_seconds", "Time spent rendering templates."),
+                ("password_hash_seconds_total", "hash_seconds", "Time spent waiting for bcrypt.")):
+            family(name, "counter", help_text)
+            for (method, route), metrics in routes:
+                lines.append(f'{PREFIX}_{name}{{method="{method}",route="{route}"}} {getattr(metrics, attribute)}')
+        for collector, collect in self.collectors.items():
+            for key, value in _flatten(collect()):
+                family(f"{collector}_{key}", "gauge", f"{collector} {key.replace('_', ' ')}.")
+                lines.append(f"{PREFIX}_{collector}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(values: dict, prefix: str = ""):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+registry = Registry()
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unmatched")
+    # Mounted apps (static files) do not set the route.
+    root_path = scope.get("root_path", "")
+    return root_path or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing each HTTP request and recording its stats.
+    """
+
+    def __init__(self, app, registry: Registry = registry, slow_seconds: float = SLOW_REQUEST_SECONDS):
+        self.app = app
+        self.registry = registry
+        self.slow_seconds = slow_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        streaming = False
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(name == b"content-type" and value.startswith(b"text/event-stream")
+                                for name, value in message.get("headers", ()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            route = _route_label(scope)
+            self.registry.routes[scope["method"], route].observe(status, elapsed, stats)
+            # Event streams stay open by design; their length says nothing about the server.
+            if elapsed >= self.slow_seconds and not streaming:
+                log_slow_request(scope["method"], route, status, elapsed, stats)
+
+
+def log_slow_request(method: str, route: str, status: int, seconds: float, stats: RequestStats):
+    slowest = sorted(stats.queries, key=lambda query: query[1], reverse=True)[:SLOW_LOG_STATEMENTS]
+    slow_log.warning(
+        "slow request %s %s -> %s in %.3fs: %d statements, db %.3fs, templates %.3fs, bcrypt %.3fs%s",
+        method, route, status, seconds, stats.statements, stats.db_seconds, stats.template_seconds,
+        stats.hash_seconds, "".join(f"\n  {duration:.4f}s {statement}" for statement, duration in slowest),
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    _record(stats, statement, time.perf_counter() - conn.info["metrics_started"].pop())
+
+
+def _handle_error(context):
+    # A statement that raised never reaches after_cursor_execute; drop its start time here.
+    stats = _current.get()
+    if stats is None or context.connection is None or context.statement is None:
+        return
+    started = context.connection.info.get("metrics_started")
+    if started:
+        _record(stats, context.statement, time.perf_counter() - started.pop())
+
+
+def _record(stats: RequestStats, statement: str, duration: float):
+    stats.statements += 1
+    stats.db_seconds += duration
+    if len(stats.queries) < MAX_RECORDED_STATEMENTS:
+        stats.queries.append((statement, duration))
+
+
+def instrument_engine(engine):
+    """
+    Count and time the statements ``engine`` (sync, or the sync side of an async
+    engine) runs on behalf of a request.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class TimedTemplate(Template):
+    """
+    A Jinja template that adds its render time to the current request.
+    """
+
+    def render(self, *args, **kwargs) -> str:
+        stats = _current.get()
+        if stats is None:
+            return super().render(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+
+def instrument_templates(templates):
+    """
+    Time the renders of the templates ``templates`` loads from now on.
+    """
+    templates.env.template_class = TimedTemplate
+    return templates
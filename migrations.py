@@ -0,0 +1,270 @@
+"""
+Versioned schema migrations.
+
+``Base.metadata.create_all`` only creates missing tables, so columns, indexes
+and constraints added to the models never reach an existing database. Each
+change to the schema is therefore also recorded here as a numbered migration,
+and the versions applied to a database are kept in ``schema_migrations``.
+
+A new, empty database is created from the models and stamped with every
+version. An existing one gets the migrations it has not recorded, in order.
+Every migration checks what is already there before changing it, so
+databases created by ``create_all`` before versioning existed are brought up
+to date as well.
+
+Migrating holds the database's write lock (``BEGIN IMMEDIATE`` on SQLite, a
+transaction-level advisory lock on PostgreSQL) from before the applied
+versions are read until the last one is stamped, so workers starting side by
+side migrate one after another: the first applies the migrations, the rest
+find nothing pending.
+
+The application migrates on startup. From the command line::
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied and pending migrations
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+import database
+import models
+import stats
+from models import Base, favourites_table
+from search import ensure_search_index
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# How long a worker waits for another one's migrations to finish.
+LOCK_TIMEOUT = float(os.getenv("MIGRATION_LOCK_TIMEOUT", "600"))
+# Any constant shared by every worker; "mig" in ASCII.
+ADVISORY_LOCK_KEY = 0x6D6967
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str):
+    """
+    Register the decorated ``upgrade(conn)`` as migration ``version``.
+    """
+    def register(upgrade):
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version, "migrations must be added in order"
+        MIGRATIONS.append(Migration(version, name, upgrade))
+        return upgrade
+    return register
+
+
+def _columns(conn, table: str) -> set[str]:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _add_column(conn, column: Column):
+    table = column.table.name
+    if column.name in _columns(conn, table):
+        return
+    ddl = f"{column.name} {column.type.compile(conn.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+
+
+def _create_index(conn, table: Table, name: str):
+    index = next(index for index in table.indexes if index.name == name)
+    existing = {index["name"]: index for index in inspect(conn).get_indexes(table.name)}
+    if name in existing and bool(existing[name]["unique"]) != bool(index.unique):
+        conn.execute(text(f"DROP INDEX {name}"))
+    index.create(conn, checkfirst=True)
+
+
+@migration(1, "create missing tables")
+def _create_tables(conn):
+    Base.metadata.create_all(conn)
+
+
+@migration(2, "event seat counters")
+def _seat_counters(conn):
+    _add_column(conn, models.Event.__table__.c.capacity)
+    _add_column(conn, models.Event.__table__.c.tickets_sold)
+    # Plain SQL: the models' onupdate would touch columns a later migration adds.
+    conn.execute(text(
+        "UPDATE events SET tickets_sold = (SELECT count(*) FROM tickets "
+        "WHERE tickets.event_id = events.id AND tickets.status = 'bought')"
+    ))
+
+
+@migration(3, "row versions")
+def _row_versions(conn):
+    for model in (models.Event, models.Speaker, models.Sponsor, models.Feedback, models.Ticket):
+        table = model.__table__
+        _add_column(conn, table.c.updated_at)
+        conn.execute(text(f"UPDATE {table.name} SET updated_at = :now WHERE updated_at IS NULL"),
+                     {"now": datetime.utcnow()})
+
+
+@migration(4, "unique usernames")
+def _unique_usernames(conn):
+    duplicates = conn.scalars(text(
+        "SELECT username FROM users GROUP BY username HAVING count(*) > 1 ORDER BY username LIMIT 10"
+    )).all()
+    if duplicates:
+        # Which account keeps the name is for an operator to decide, not for a migration.
+        raise RuntimeError(
+            "cannot make usernames unique, rename or remove the duplicate accounts first: "
+            + ", ".join(map(repr, duplicates))
+        )
+    _create_index(conn, models.User.__table__, "ix_users_username")
+
+
+@migration(5, "favorites primary key")
+def _favorites_primary_key(conn):
+    if inspect(conn).get_pk_constraint("favorites")["constrained_columns"]:
+        return
+    conn.execute(text("ALTER TABLE favorites RENAME TO favorites_unkeyed"))
+    favourites_table.create(conn)
+    conn.execute(text(
+        "INSERT INTO favorites (user_id, event_id) SELECT DISTINCT user_id, event_id FROM favorites_unkeyed "
+        "WHERE user_id IS NOT NULL AND event_id IS NOT NULL"
+    ))
+    conn.execute(text("DROP TABLE favorites_unkeyed"))
+
+
+@migration(6, "hot lookup indexes")
+def _lookup_indexes(conn):
+    for table, name in (
+        (models.Event.__table__, "ix_events_date_id"),
+        (models.Event.__table__, "ix_events_place_date_id"),
+        (models.Event.__table__, "ix_events_price"),
+        (models.Ticket.__table__, "ix_tickets_event_id"),
+        (models.Ticket.__table__, "ix_tickets_user_id"),
+        (models.Feedback.__table__, "ix_feedbacks_event_id"),
+        (models.Sponsor.__table__, "ix_sponsors_event_id"),
+        (models.Speaker.__table__, "ix_speakers_event_id"),
+        (favourites_table, "ix_favorites_event_id"),
+    ):
+        _create_index(conn, table, name)
+
+
+@migration(7, "event search index")
+def _search_index(conn):
+    ensure_search_index(conn)
+
+
+@migration(8, "event stats backfill")
+def _event_stats(conn):
+    # Databases older than the aggregates have an empty event_stats table.
+    stats.recompute(conn)
+
+
+@migration(9, "job queue")
+def _job_queue(conn):
+    models.Job.__table__.create(conn, checkfirst=True)
+
+
+def _stamp(conn, migrations):
+    if migrations:
+        conn.execute(schema_migrations.insert(), [
+            {"version": m.version, "name": m.name, "applied_at": datetime.utcnow()} for m in migrations])
+
+
+def _lock(conn: Connection, timeout: float = LOCK_TIMEOUT):
+    """
+    Take the lock that serializes migrations, for the rest of the transaction.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+    elif conn.dialect.name == "sqlite":
+        # busy_timeout bounds each attempt; another worker's migrations may take longer.
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+                return
+            except OperationalError as exc:
+                if "locked" not in str(exc.orig) or time.monotonic() > deadline:
+                    raise
+
+
+def migrate(conn: Connection) -> list[str]:
+    """
+    Bring the database behind ``conn`` up to the latest version.
+
+    Takes a sync connection, so async code can call it through ``run_sync``.
+    It must not have run anything yet: the migration lock is taken first and
+    held until the connection's transaction ends.
+
+    Returns:
+        list[str]: The names of the migrations applied.
+    """
+    _lock(conn)
+    tables = set(inspect(conn).get_table_names()) - {schema_migrations.name}
+    schema_migrations.create(conn, checkfirst=True)
+    if not tables:
+        Base.metadata.create_all(conn)
+        ensure_search_index(conn)
+        _stamp(conn, MIGRATIONS)
+        return ["create schema"]
+
+    applied = set(conn.scalars(select(schema_migrations.c.version)))
+    pending = [m for m in MIGRATIONS if m.version not in applied]
+    for m in pending:
+        m.upgrade(conn)
+        _stamp(conn, [m])
+    return [m.name for m in pending]
+
+
+def upgrade(engine: Engine = None) -> list[str]:
+    """
+    Apply the pending migrations to ``engine`` (the application's by default).
+    """
+    with (engine or database.engine).begin() as conn:
+        return migrate(conn)
+
+
+def status(engine: Engine = None) -> list[dict]:
+    """
+    List every migration with the time it was applied, or ``None`` if pending.
+    """
+    with (engine or database.engine).connect() as conn:
+        applied = {}
+        if inspect(conn).has_table(schema_migrations.name):
+            applied = dict(conn.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at)).all())
+    return [{"version": m.version, "name": m.name, "applied_at": applied.get(m.version)} for m in MIGRATIONS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply or list the schema migrations.")
+    parser.add_argument("--status", action="store_true", help="list migrations instead of applying them")
+    args = parser.parse_args()
+    if args.status:
+        for row in status():
+            applied = row["applied_at"].isoformat(sep=" ", timespec="seconds") if row["applied_at"] else "pending"
+            print(f"{row['version']:>4}  {row['name']:<28} {applied}")
+    else:
+        applied = upgrade()
+        print("\n".join(f"applied: {name}" for name in applied) or "database is up to date")
+    database.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
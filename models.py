@@ -1,24 +1,21 @@
-import os
-from sqlalchemy import Column, String, Integer, create_engine, DateTime, ForeignKey, Float, Table
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Float, Table, Index, JSON
 from sqlalchemy import Enum as SQLEnum
 import enum
+from datetime import datetime
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
-from dotenv import load_dotenv
-load_dotenv()
-DB_URL = os.getenv('DB_URL')
-print(DB_URL)
+from sqlalchemy.orm import relationship
 
 
 Base = declarative_base()
-engine = create_engine("sqlite:///./simple.db", connect_args={'check_same_thread': False})
-Sessionlocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 favourites_table = Table(
     "favorites",
     Base.metadata,
-    Column("user_id", Integer, ForeignKey("users.id"),),
-    Column("event_id", Integer, ForeignKey("events.id"))
+    # One row per user and event, so adding a favorite twice is a no-op.
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("event_id", Integer, ForeignKey("events.id"), primary_key=True),
+    # The primary key serves lookups by user; this one serves lookups by event.
+    Index("ix_favorites_event_id", "event_id"),
 )
 
 class TicketStatuses(str, enum.Enum):
@@ -29,7 +26,7 @@ class TicketStatuses(str, enum.Enum):
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, nullable=False)
+    username = Column(String, nullable=False, unique=True, index=True)
     surname = Column(String)
     email = Column(String)
     password = Column(String, nullable=False)
@@ -43,8 +40,27 @@ class Event(Base):
     place = Column(String)
     description = Column(String(500))
     price = Column(Float)
+    # Seats on sale (None means unlimited) and seats currently held by bought tickets.
+    capacity = Column(Integer)
+    tickets_sold = Column(Integer, nullable=False, default=0, server_default="0")
+    # Row version for HTTP validators; writes to child rows touch it too.
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     speaker_id = Column(ForeignKey("speakers.id"))
     liked = relationship("User", secondary=favourites_table, back_populates="favorites")
+    # Child collections never lazy load: each view picks its own loader options
+    # so a page of events renders in a fixed number of queries.
+    speaker = relationship("Speaker", foreign_keys=[speaker_id], lazy="raise")
+    speakers = relationship("Speaker", foreign_keys="Speaker.event_id", back_populates="event", lazy="raise")
+    sponsors = relationship("Sponsor", back_populates="event", lazy="raise")
+    feedbacks = relationship("Feedback", back_populates="event", lazy="raise")
+    tickets = relationship("Ticket", back_populates="event", lazy="raise")
+
+    # Keyset pagination walks events in (date, id) order, optionally within one place.
+    __table_args__ = (
+        Index("ix_events_date_id", "date", "id"),
+        Index("ix_events_place_date_id", "place", "date", "id"),
+        Index("ix_events_price", "price"),
+    )
 
 class Speaker(Base):
     __tablename__ = "speakers"
@@ -52,7 +68,9 @@ class Speaker(Base):
     name = Column(String, nullable=False)
     surname = Column(String)
     description = Column(String)
-    event_id = Column(ForeignKey("events.id"))
+    event_id = Column(ForeignKey("events.id"), index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    event = relationship("Event", foreign_keys=[event_id], back_populates="speakers", lazy="raise")
 
 
 class Sponsor(Base):
@@ -60,29 +78,67 @@ class Sponsor(Base):
     id = Column(Integer, primary_key=True, index=True)
     firm_name = Column(String)
     contacts = Column(String)
-    event_id = Column(ForeignKey("events.id"))
+    event_id = Column(ForeignKey("events.id"), index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    event = relationship("Event", back_populates="sponsors", lazy="raise")
 
 
 class Feedback(Base):
     __tablename__ = "feedbacks"
     id = Column(Integer, primary_key=True, index=True)
-    event_id = Column(ForeignKey("events.id"))
+    event_id = Column(ForeignKey("events.id"), index=True)
     user_id = Column(ForeignKey("users.id"))
     rating = Column(Integer)
     comment = Column(String(500))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    event = relationship("Event", back_populates="feedbacks", lazy="raise")
 
 
 class Ticket(Base):
     __tablename__ = "tickets"
     id = Column(Integer, primary_key=True, index=True)
-    event_id = Column(ForeignKey("events.id"), nullable=False)
-    user_id = Column(ForeignKey("users.id"), nullable=False)
+    event_id = Column(ForeignKey("events.id"), nullable=False, index=True)
+    user_id = Column(ForeignKey("users.id"), nullable=False, index=True)
     price = Column(Float)
     status = Column(SQLEnum(TicketStatuses), default=TicketStatuses.bought)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    event = relationship("Event", back_populates="tickets", lazy="raise")
+
+
+# Per-event counters maintained by the write paths, so reading them is a primary key lookup.
+class EventStats(Base):
+    __tablename__ = "event_stats"
+    event_id = Column(ForeignKey("events.id"), primary_key=True)
+    tickets_bought = Column(Integer, nullable=False, default=0, server_default="0")
+    tickets_in_process = Column(Integer, nullable=False, default=0, server_default="0")
+    tickets_returned = Column(Integer, nullable=False, default=0, server_default="0")
+    favorites = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class JobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    dead = "dead"
+
+
+# Durable background work, see jobs.py. Finished jobs are deleted; jobs that
+# ran out of attempts stay behind as ``dead``.
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(SQLEnum(JobStatus), nullable=False, default=JobStatus.queued)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts = Column(Integer, nullable=False)
+    # When a queued job may run next; for a running job, when its lease expires
+    # and another worker may take it over.
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
-def get_db():
-    db = Sessionlocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
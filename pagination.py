@@ -0,0 +1,138 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Query
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def pack_cursor(*key) -> str:
+    """
+    Wrap a sort key (JSON-serializable values) into an opaque URL-safe token.
+    """
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def unpack_cursor(cursor: str, size: int) -> list:
+    """
+    Unwrap a token made by :func:`pack_cursor` holding a key of ``size`` values.
+
+    Raises:
+        HTTPException: If the cursor is malformed.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        key = None
+    if not isinstance(key, list) or len(key) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+def encode_cursor(event: models.Event) -> str:
+    """
+    Build an opaque cursor pointing just after the given event.
+
+    The cursor is the event's ``(date, id)`` sort key, JSON encoded and
+    wrapped in URL-safe base64 so clients treat it as a token.
+    """
+    return pack_cursor(event.date.isoformat() if event.date else None, event.id)
+
+
+def decode_cursor(cursor: str) -> tuple[Optional[datetime], int]:
+    """
+    Decode a cursor produced by :func:`encode_cursor`.
+
+    Raises:
+        HTTPException: If the cursor is malformed.
+    """
+    date, event_id = unpack_cursor(cursor, 2)
+    try:
+        return (datetime.fromisoformat(date) if date else None), int(event_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def event_page_params(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    place: Optional[str] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+) -> dict:
+    """
+    Query parameters shared by every paginated event listing.
+    """
+    return {
+        "cursor": cursor,
+        "limit": limit,
+        "date_from": date_from,
+        "date_to": date_to,
+        "place": place,
+        "price_min": price_min,
+        "price_max": price_max,
+    }
+
+
+async def fetch_event_page(db: AsyncSession, cursor=None, limit=DEFAULT_PAGE_SIZE, date_from=None, date_to=None,
+                           place=None, price_min=None, price_max=None, options=()):
+    """
+    Fetch one page of events ordered by ``(date, id)``.
+
+    Instead of an OFFSET the query seeks past the last row of the previous
+    page, so it is served by the ``(date, id)`` / ``(place, date, id)``
+    indexes and every page costs the same regardless of its position.
+
+    ``options`` are loader options (e.g. ``selectinload(Event.sponsors)``) for
+    the relationships the caller is going to render.
+
+    Returns:
+        tuple[list[Event], Optional[str]]: The events on the page and the
+        cursor of the next page, or ``None`` if this is the last one.
+    """
+    Event = models.Event
+    query = select(Event).options(*options)
+
+    if date_from is not None:
+        query = query.where(Event.date >= date_from)
+    if date_to is not None:
+        query = query.where(Event.date < date_to)
+    if place is not None:
+        query = query.where(Event.place == place)
+    if price_min is not None:
+        query = query.where(Event.price >= price_min)
+    if price_max is not None:
+        query = query.where(Event.price <= price_max)
+
+    order = (Event.date.asc().nulls_first(), Event.id.asc())
+    rows = []
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        if last_date is None:
+            # Undated events sort first: finish them off by id, then start on the
+            # dated ones. Two seeks, as one OR of both would scan the index.
+            undated = query.where(Event.date.is_(None), Event.id > last_id)
+            rows = (await db.execute(undated.order_by(*order).limit(limit + 1))).scalars().all()
+            query = query.where(Event.date.isnot(None))
+        else:
+            # A row-value comparison is what the planner can seek the (date, id) index with.
+            query = query.where(tuple_(Event.date, Event.id) > tuple_(last_date, last_id))
+
+    if len(rows) <= limit:
+        query = query.order_by(*order).limit(limit + 1 - len(rows))
+        rows += (await db.execute(query)).scalars().all()
+
+    events = rows[:limit]
+    next_cursor = encode_cursor(events[-1]) if len(rows) > limit else None
+    return events, next_cursor
@@ -0,0 +1,121 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+import metrics
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "64"))
+
+
+def _hash(password: str):
+    started = time.time()
+    return pwd_context.hash(password), started, time.time()
+
+
+def _verify(password: str, hashed: str):
+    started = time.time()
+    return pwd_context.verify(password, hashed), started, time.time()
+
+
+class Timing:
+    """
+    Count, total and maximum of a series of durations, in seconds.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a dedicated process pool so it neither blocks the event loop
+    nor competes with request handling for the GIL.
+
+    At most ``queue_limit`` calls may wait for a free worker; beyond that new
+    calls are rejected with 503 so a login burst sheds load instead of piling
+    up. ``pending`` is compared with the limit and incremented before the
+    call's first ``await``, so a burst cannot overshoot the queue limit.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.rejected = 0
+        self.latency = Timing()
+        self.queue_wait = Timing()
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking a process that already runs the DB driver threads is unsafe.
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.pending - self.workers >= self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, try again shortly",
+                                headers={"Retry-After": "1"})
+
+        self.pending += 1
+        submitted = time.time()
+        try:
+            result, started, finished = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+            request = metrics.current()
+            if request is not None:
+                request.hash_seconds += time.time() - submitted
+
+        self.queue_wait.observe(max(started - submitted, 0.0))
+        self.latency.observe(finished - started)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_verify, password, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self.pending,
+            "queued": max(self.pending - self.workers, 0),
+            "rejected": self.rejected,
+            "hash_latency": self.latency.stats(),
+            "queue_wait": self.queue_wait.stats(),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,200 @@
+"""
+Per-client rate limits on the endpoints that cost the most.
+
+Each limited route has a token bucket per client: ``capacity`` requests may
+come in a burst, and the bucket refills at ``capacity / period`` requests per
+second. A client is the signed-in user (the ``sub`` of a valid access token)
+or else the IP address, so one abusive client only exhausts its own bucket.
+A request that finds its bucket empty is rejected with 429 and a
+``Retry-After`` giving the seconds until a token is back, before it touches
+the database or the password hasher.
+
+The limits are set with ``RATE_LIMIT_<NAME>=<requests>/<seconds>`` (e.g.
+``RATE_LIMIT_LOGIN=10/60``) and switched off with ``RATE_LIMIT_ENABLED=0``.
+Behind a proxy, run uvicorn with ``--proxy-headers`` so that the client
+address is the one the proxy saw.
+
+The buckets live in :class:`MemoryBackend`, per process. A check reads,
+refills and writes back its bucket without an ``await`` in between, so two
+requests of one client cannot both spend its last token. With several
+workers every worker keeps its own buckets and a client gets up to the limit
+from each, so divide the limits by the number of workers. Any object with the
+``take`` coroutine of :class:`MemoryBackend` can stand in for it, e.g. one
+sharing the buckets between workers.
+"""
+import itertools
+import math
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from fastapi import Depends, HTTPException, Request
+
+ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# Buckets kept per limit before idle ones are dropped.
+MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+@dataclass(frozen=True, slots=True)
+class Limit:
+    name: str
+    capacity: int
+    period: float
+    # Tokens added back per second.
+    rate: float = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "rate", self.capacity / self.period)
+
+    @classmethod
+    def from_env(cls, name: str, default: str) -> "Limit":
+        """
+        Read ``RATE_LIMIT_<NAME>`` as ``<requests>/<seconds>``, ``default`` if unset.
+        """
+        requests, _, seconds = os.getenv(f"RATE_LIMIT_{name.upper()}", default).partition("/")
+        return cls(name, int(requests), float(seconds))
+
+
+LIMITS = {limit.name: limit for limit in (
+    # Every attempt is a bcrypt verification.
+    Limit.from_env("login", "10/60"),
+    # Each purchase is a write transaction and a queued job.
+    Limit.from_env("buy_ticket", "30/60"),
+    # Adding and removing share one bucket.
+    Limit.from_env("favorites", "60/60"),
+    Limit.from_env("list_events", "120/60"),
+)}
+
+
+class MemoryBackend:
+    """
+    Token buckets in a dict per limit, for a single process.
+
+    A bucket is ``[tokens, updated]``; it is refilled lazily when checked.
+    """
+
+    def __init__(self, max_keys: int = MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self.buckets = defaultdict(dict)
+
+    def consume(self, limit: Limit, key, cost: float = 1) -> float:
+        """
+        Take ``cost`` tokens from the bucket of ``key``.
+
+        Returns:
+            float: 0 if they were taken, otherwise the seconds until they
+            will be available (nothing is taken then).
+        """
+        now = self.clock()
+        buckets = self.buckets[limit.name]
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.max_keys:
+                self._prune(limit, buckets, now)
+            buckets[key] = [limit.capacity - cost, now]
+            return 0.0
+        tokens = bucket[0] + (now - bucket[1]) * limit.rate
+        capacity = limit.capacity
+        if tokens > capacity:
+            tokens = capacity
+        bucket[1] = now
+        if tokens >= cost:
+            bucket[0] = tokens - cost
+            return 0.0
+        bucket[0] = tokens
+        return (cost - tokens) / limit.rate
+
+    async def take(self, limit: Limit, key, cost: float = 1) -> float:
+        return self.consume(limit, key, cost)
+
+    def _prune(self, limit: Limit, buckets: dict, now: float):
+        # A bucket that has refilled is the same as no bucket.
+        for key in [key for key, (tokens, updated) in buckets.items()
+                    if tokens + (now - updated) * limit.rate >= limit.capacity]:
+            del buckets[key]
+        # Every client is active: forget the oldest buckets rather than grow.
+        excess = len(buckets) - self.max_keys * 9 // 10
+        for key in list(itertools.islice(buckets, max(excess, 0))):
+            del buckets[key]
+
+    def stats(self) -> dict:
+        return {name: len(buckets) for name, buckets in self.buckets.items()}
+
+
+class RateLimiter:
+    """
+    Checks requests against their route's :class:`Limit` and counts the outcomes.
+    """
+
+    def __init__(self, backend=None, enabled: bool = ENABLED):
+        self.backend = backend or MemoryBackend()
+        self.enabled = enabled
+        self.allowed = 0
+        self.limited = 0
+
+    async def check(self, limit: Limit, request: Request):
+        """
+        Raises:
+            HTTPException: If the client's bucket for ``limit`` is empty (429).
+        """
+        if not self.enabled:
+            return
+        wait = await self.backend.take(limit, client_key(request))
+        if wait:
+            self.limited += 1
+            raise HTTPException(status_code=429, detail="Too many requests",
+                                headers={"Retry-After": str(math.ceil(wait))})
+        self.allowed += 1
+
+    def stats(self) -> dict:
+        return {"enabled": int(self.enabled), "allowed": self.allowed, "limited": self.limited,
+                "buckets": self.backend.stats()}
+
+
+def client_key(request: Request) -> str:
+    """
+    ``user:<id>`` for a request with a valid access token, ``ip:<address>`` otherwise.
+
+    The key is kept in the request's scope, so further checks of the same
+    request do not resolve it again.
+    """
+    scope = request.scope
+    key = scope.get("ratelimit.client")
+    if key is not None:
+        return key
+    token = request.cookies.get("access_token")
+    user_id = None
+    if token:
+        # auth puts its routes behind these limits, so it is imported here rather than on top.
+        from auth import token_user_id
+        user_id = token_user_id(token)
+    if user_id is not None:
+        key = f"user:{user_id}"
+    else:
+        # The raw (host, port) pair; request.client wraps it in a new Address every time.
+        client = scope.get("client")
+        key = f"ip:{client[0] if client else 'unknown'}"
+    scope["ratelimit.client"] = key
+    return key
+
+
+limiter = RateLimiter()
+
+
+def rate_limit(name: str):
+    """
+    A route dependency enforcing the limit ``name`` of :data:`LIMITS`::
+
+        @router.post("/tickets", dependencies=[rate_limit("buy_ticket")])
+
+    Route dependencies run before the endpoint's own, so a rejected request
+    opens no database session.
+    """
+    limit = LIMITS[name]
+
+    async def check_rate_limit(request: Request):
+        await limiter.check(limit, request)
+
+    return Depends(check_rate_limit)
@@ -1,4 +1,9 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from models import TicketStatuses
 
 
 class UserCreate(BaseModel):
@@ -23,14 +28,24 @@ class EventOut(BaseModel):
     id: int
     name: str
     description: str
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class EventPage(BaseModel):
+    items: list[EventOut]
+    next_cursor: Optional[str] = None
+
+
 class EventCreate(BaseModel):
     name: str
     description: str
+    date: Optional[datetime] = None
+    place: Optional[str] = None
+    price: Optional[float] = None
+    capacity: Optional[int] = None
 
 
 class TicketCreate(BaseModel):
@@ -42,6 +57,8 @@ class TicketOut(BaseModel):
     id: int
     event_id: int
     user_id: int
+    price: Optional[float] = None
+    status: TicketStatuses
 
     class Config:
         from_attributes = True
@@ -50,6 +67,7 @@ class TicketOut(BaseModel):
 class FeedbackCreate(BaseModel):
     event_id: int
     user_id: int
+    rating: Optional[int] = Field(None, ge=1, le=5)
     comment: str
 
 
@@ -57,6 +75,7 @@ class FeedbackOut(BaseModel):
     id: int
     event_id: int
     user_id: int
+    rating: Optional[int] = None
     comment: str
 
     class Config:
@@ -66,6 +85,7 @@ class FeedbackOut(BaseModel):
 class SponsorCreate(BaseModel):
     event_id: int
     firm_name: str
+    contacts: Optional[str] = None
 
 
 class SponsorOut(BaseModel):
@@ -80,6 +100,8 @@ class SponsorOut(BaseModel):
 class SpeakerCreate(BaseModel):
     event_id: int   
     name: str
+    surname: Optional[str] = None
+    description: Optional[str] = None
 
 
 class SpeakerOut(BaseModel):
@@ -89,3 +111,13 @@ class SpeakerOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class EventStatsOut(BaseModel):
+    event_id: int
+    tickets_bought: int = 0
+    tickets_in_process: int = 0
+    tickets_returned: int = 0
+    favorites: int = 0
+    rating_count: int = 0
+    average_rating: Optional[float] = None
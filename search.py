@@ -0,0 +1,129 @@
+"""
+Full-text event search backed by an SQLite FTS5 index.
+
+``events_fts`` holds one row per event (``rowid`` = event id) with its name,
+description, place and the names of its speakers and sponsors. Triggers on the
+events, speakers and sponsors tables keep it in sync, so every write path -
+the create handlers, bulk imports, manual SQL - is indexed without extra code.
+
+BM25 is computed per match, so ranking cannot use an index and costs time in
+proportion to the number of matches. A search therefore ranks at most
+``SEARCH_MAX_MATCHES`` matching events, the newest ones (FTS5 yields matches in
+rowid order without sorting); a broader query pages through the best of those
+rather than of every match. Each page re-ranks the same bounded set.
+"""
+import os
+
+from fastapi import HTTPException
+from sqlalchemy import column, func, literal_column, select, table, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from pagination import pack_cursor, unpack_cursor
+
+# Column weights for bm25(): a hit in the name counts most, the description least.
+WEIGHTS = (10.0, 1.0, 2.0, 3.0, 3.0)
+# Matches ranked per search, see above.
+MAX_MATCHES = int(os.getenv("SEARCH_MAX_MATCHES", "1000"))
+
+_SPEAKERS = ("(SELECT coalesce(group_concat(trim(coalesce(name, '') || ' ' || coalesce(surname, ''))), '') "
+             "FROM speakers WHERE event_id = {event_id})")
+_SPONSORS = "(SELECT coalesce(group_concat(firm_name), '') FROM sponsors WHERE event_id = {event_id})"
+
+# The last search word is matched as a prefix; the 2 and 3 character prefix
+# indexes stop short prefixes from expanding into a walk over the term list.
+SCHEMA = [
+    "CREATE VIRTUAL TABLE events_fts USING fts5("
+    "name, description, place, speakers, sponsors, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "CREATE TRIGGER events_fts_ai AFTER INSERT ON events BEGIN "
+    "INSERT INTO events_fts (rowid, name, description, place, speakers, sponsors) "
+    "VALUES (new.id, new.name, new.description, new.place, '', ''); END",
+    "CREATE TRIGGER events_fts_au AFTER UPDATE OF name, description, place ON events BEGIN "
+    "UPDATE events_fts SET name = new.name, description = new.description, place = new.place "
+    "WHERE rowid = new.id; END",
+    "CREATE TRIGGER events_fts_ad AFTER DELETE ON events BEGIN "
+    "DELETE FROM events_fts WHERE rowid = old.id; END",
+]
+for _table, _column, _names in (("speakers", "speakers", _SPEAKERS), ("sponsors", "sponsors", _SPONSORS)):
+    for _suffix, _when, _refs in (("ai", "INSERT", ("new",)), ("ad", "DELETE", ("old",)),
+                                  ("au", "UPDATE", ("old", "new"))):
+        SCHEMA.append(
+            f"CREATE TRIGGER {_table}_fts_{_suffix} AFTER {_when} ON {_table} BEGIN "
+            + " ".join(f"UPDATE events_fts SET {_column} = {_names.format(event_id=ref + '.event_id')} "
+                       f"WHERE rowid = {ref}.event_id;" for ref in _refs)
+            + " END"
+        )
+
+BACKFILL = (
+    "INSERT INTO events_fts (rowid, name, description, place, speakers, sponsors) "
+    f"SELECT e.id, e.name, e.description, e.place, {_SPEAKERS.format(event_id='e.id')}, "
+    f"{_SPONSORS.format(event_id='e.id')} FROM events e"
+)
+
+events_fts = table("events_fts", column("rowid"), column("events_fts"))
+
+
+def ensure_search_index(conn):
+    """
+    Create the FTS table and its triggers if missing, indexing existing events.
+
+    Takes a sync connection; does nothing on databases other than SQLite.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events_fts'")).first()
+    if exists:
+        return
+    for statement in SCHEMA:
+        conn.execute(text(statement))
+    conn.execute(text(BACKFILL))
+
+
+def match_expression(query: str) -> str:
+    """
+    Turn free text into an FTS5 query that matches every word.
+
+    Words are quoted so user input cannot inject FTS syntax; the last word is
+    matched as a prefix to support search-as-you-type.
+    """
+    words = ['"' + word.replace('"', '""') + '"' for word in query.split()]
+    if words:
+        words[-1] += "*"
+    return " ".join(words)
+
+
+async def search_events(db: AsyncSession, query: str, limit: int, cursor=None):
+    """
+    Fetch one page of events matching ``query``, best matches first.
+
+    Pages are keyed on ``(bm25 rank, id)`` like the date-ordered listing.
+    Only the newest ``MAX_MATCHES`` matches are ranked.
+
+    Returns:
+        tuple[list[Event], Optional[str]]: The events on the page and the
+        cursor of the next page, or ``None`` if this is the last one.
+    """
+    match = match_expression(query)
+    if not match:
+        return [], None
+
+    Event = models.Event
+    matches = (
+        select(events_fts.c.rowid.label("id"),
+               func.bm25(literal_column("events_fts"), *WEIGHTS).label("rank"))
+        .where(events_fts.c.events_fts.op("MATCH")(match))
+        .order_by(events_fts.c.rowid.desc())
+        .limit(MAX_MATCHES)
+        .subquery()
+    )
+    stmt = select(Event, matches.c.rank).join(matches, matches.c.id == Event.id)
+    if cursor:
+        last_rank, last_id = unpack_cursor(cursor, 2)
+        if not isinstance(last_rank, (int, float)) or not isinstance(last_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(tuple_(matches.c.rank, Event.id) > tuple_(last_rank, last_id))
+
+    rows = (await db.execute(stmt.order_by(matches.c.rank, Event.id).limit(limit + 1))).all()
+    page = rows[:limit]
+    next_cursor = pack_cursor(page[-1].rank, page[-1].Event.id) if len(rows) > limit else None
+    return [row.Event for row in page], next_cursor
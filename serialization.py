@@ -0,0 +1,55 @@
+"""
+Fast JSON encoding of list responses.
+
+Returning ORM objects under a ``response_model`` makes FastAPI build and
+validate one pydantic object per row, dump it back to Python data and only
+then encode it. List endpoints instead select the schema's columns as plain
+rows and encode them in one ``pydantic_core.to_json`` call, returning the
+bytes in a :class:`RawJSONResponse`. The routes keep their ``response_model``,
+so the OpenAPI documentation is unchanged; it is just not used at runtime.
+"""
+from operator import attrgetter
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+from sqlalchemy import Select, select
+
+
+class RawJSONResponse(Response):
+    """
+    A JSON response whose body is already encoded.
+    """
+    media_type = "application/json"
+
+
+def select_fields(model, schema: type[BaseModel]) -> Select:
+    """
+    Select the columns of ``model`` that ``schema`` exposes, as plain rows.
+    """
+    return select(*(getattr(model, name) for name in schema.model_fields))
+
+
+def row_dicts(schema: type[BaseModel], rows) -> list[dict]:
+    """
+    Map rows (or ORM objects) to dicts of the fields of ``schema``.
+    """
+    names = tuple(schema.model_fields)
+    values = attrgetter(*names)
+    if len(names) == 1:
+        return [{names[0]: values(row)} for row in rows]
+    return [dict(zip(names, values(row))) for row in rows]
+
+
+def encode_rows(schema: type[BaseModel], rows) -> bytes:
+    """
+    Encode rows as the JSON array ``list[schema]`` would produce.
+    """
+    return to_json(row_dicts(schema, rows))
+
+
+def encode_page(schema: type[BaseModel], rows, next_cursor) -> bytes:
+    """
+    Encode one page of rows in the ``{"items": [...], "next_cursor": ...}`` shape.
+    """
+    return to_json({"items": row_dicts(schema, rows), "next_cursor": next_cursor})
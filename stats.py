@@ -0,0 +1,123 @@
+"""
+Incrementally maintained per-event aggregates.
+
+Write paths call :func:`bump` inside their own transaction, so the counters
+change atomically with the rows they describe. :func:`rebuild` recomputes
+them from the base tables, e.g. for events that predate the aggregate table::
+
+    python stats.py --rebuild
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+from models import EventStats, Feedback, Ticket, TicketStatuses, favourites_table
+
+COUNTERS = ("tickets_bought", "tickets_in_process", "tickets_returned", "favorites", "rating_sum", "rating_count")
+_UPSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+async def bump(db: AsyncSession, event_id: int, **deltas: int):
+    """
+    Add ``deltas`` (e.g. ``favorites=1``) to an event's counters.
+
+    A single ``INSERT ... ON CONFLICT DO UPDATE`` creates the row on first use
+    and otherwise increments it in place, without reading it first.
+    """
+    unknown = set(deltas) - set(COUNTERS)
+    if unknown:
+        raise ValueError(f"Unknown counters: {', '.join(sorted(unknown))}")
+    table = EventStats.__table__
+    upsert = _UPSERT[db.get_bind().dialect.name]
+    stmt = upsert(table).values(event_id=event_id, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.event_id],
+        set_={name: table.c[name] + delta for name, delta in deltas.items()},
+    )
+    await db.execute(stmt)
+
+
+def to_schema(event_id: int, row) -> dict:
+    """
+    Shape an ``EventStats`` row (or ``None`` for an event without one) for the API.
+    """
+    if row is None:
+        return {"event_id": event_id}
+    return {
+        "event_id": event_id,
+        "tickets_bought": row.tickets_bought,
+        "tickets_in_process": row.tickets_in_process,
+        "tickets_returned": row.tickets_returned,
+        "favorites": row.favorites,
+        "rating_count": row.rating_count,
+        "average_rating": row.rating_sum / row.rating_count if row.rating_count else None,
+    }
+
+
+def recompute(db):
+    """
+    Recompute every event's counters from the tickets, favorites and feedbacks
+    tables, in the caller's transaction.
+
+    Takes a sync Session or Connection, so migrations can use it too.
+    """
+    def by_status(status):
+        return func.sum(case((Ticket.status == status, 1), else_=0))
+
+    tickets = select(
+        Ticket.event_id,
+        by_status(TicketStatuses.bought).label("tickets_bought"),
+        by_status(TicketStatuses.in_process).label("tickets_in_process"),
+        by_status(TicketStatuses.returned).label("tickets_returned"),
+    ).group_by(Ticket.event_id)
+    favorites = select(favourites_table.c.event_id, func.count().label("favorites")).group_by(
+        favourites_table.c.event_id)
+    ratings = select(
+        Feedback.event_id,
+        func.sum(Feedback.rating).label("rating_sum"),
+        func.count(Feedback.rating).label("rating_count"),
+    ).where(Feedback.rating.isnot(None)).group_by(Feedback.event_id)
+
+    totals = {}
+    for query in (tickets, favorites, ratings):
+        for row in db.execute(query).mappings():
+            totals.setdefault(row["event_id"], {}).update(
+                {key: value for key, value in row.items() if key != "event_id"})
+
+    db.execute(delete(EventStats))
+    if totals:
+        db.execute(insert(EventStats), [
+            {"event_id": event_id, **dict.fromkeys(COUNTERS, 0), **counters} for event_id, counters in totals.items()])
+
+
+async def rebuild(db: AsyncSession):
+    """
+    Recompute every event's counters from the tickets, favorites and feedbacks tables.
+    """
+    await db.run_sync(recompute)
+    await db.commit()
+
+
+async def _main(args):
+    import migrations  # migrations backfills the counters with recompute()
+
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(migrations.migrate)
+    if args.rebuild:
+        async with database.AsyncSessionlocal() as db:
+            await rebuild(db)
+    await database.async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the per-event aggregates.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute all counters from the base tables")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
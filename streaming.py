@@ -0,0 +1,54 @@
+"""
+Streamed JSON list responses.
+
+Rows are pulled from the database in partitions of ``YIELD_PER`` (a
+server-side cursor where the driver has one) and each partition is
+serialized and sent before the next is fetched, so memory use is bounded by
+the partition size rather than the size of the result.
+
+Two formats are offered: ``ndjson`` (one object per line) and ``json`` (a
+regular JSON array, sent in chunks).
+"""
+import os
+from typing import AsyncIterator, Literal
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from serialization import encode_rows, row_dicts
+
+YIELD_PER = int(os.getenv("STREAM_YIELD_PER", "1000"))
+
+StreamFormat = Literal["ndjson", "json"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+async def encode_stream(sessions: async_sessionmaker, stmt: Select, schema: type[BaseModel],
+                      fmt: StreamFormat) -> AsyncIterator[bytes]:
+    """
+    Run ``stmt`` in its own session and yield its rows encoded as ``schema``.
+    """
+    async with sessions() as db:
+        result = await db.stream(stmt.execution_options(yield_per=YIELD_PER))
+        if fmt == "json":
+            yield b"["
+        separator = b""
+        async for rows in result.partitions():
+            if fmt == "ndjson":
+                yield b"".join(to_json(item) + b"\n" for item in row_dicts(schema, rows))
+            else:
+                yield separator + encode_rows(schema, rows)[1:-1]
+                separator = b","
+        if fmt == "json":
+            yield b"]"
+
+
+def stream_rows(sessions: async_sessionmaker, stmt: Select, schema: type[BaseModel],
+                fmt: StreamFormat) -> StreamingResponse:
+    """
+    Respond with the rows of ``stmt`` streamed in format ``fmt``.
+    """
+    return StreamingResponse(encode_stream(sessions, stmt, schema, fmt), media_type=MEDIA_TYPES[fmt])
@@ -0,0 +1,87 @@
+"""
+The Jinja templates under ``static/``, shared by every module that renders.
+
+Templates are loaded lazily, on their first render, and compiled through a
+bytecode cache on disk, so a freshly started worker loads a template it has
+not rendered yet without compiling it again. ``python templating.py``
+compiles every template into the cache, e.g. while building a release, so
+that no worker pays for compiling one.
+
+HTML templates are autoescaped; text templates (``.txt``, e.g. receipts)
+are not.
+
+Settings:
+
+* ``TEMPLATE_CACHE_DIR``: where compiled templates are kept (by default
+  Jinja's per-user directory under the system temp dir).
+* ``TEMPLATE_BYTECODE_CACHE=0``: compile in memory only.
+* ``TEMPLATE_AUTO_RELOAD=0``: do not check templates for changes on every
+  load; for deployments whose templates only change with a restart.
+
+Usage::
+
+    python templating.py
+"""
+import argparse
+import os
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+import assets
+import metrics
+
+TEMPLATE_DIR = "static"
+CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR") or None
+BYTECODE_CACHE = os.getenv("TEMPLATE_BYTECODE_CACHE", "1") == "1"
+AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "1") == "1"
+
+
+def make_environment(directory: str = TEMPLATE_DIR, bytecode_cache: bool = BYTECODE_CACHE,
+                     cache_dir: str = CACHE_DIR) -> Environment:
+    """
+    Build a Jinja environment over ``directory`` configured as described above.
+    """
+    return Environment(
+        loader=FileSystemLoader(directory),
+        autoescape=select_autoescape(),
+        bytecode_cache=FileSystemBytecodeCache(cache_dir) if bytecode_cache else None,
+        auto_reload=AUTO_RELOAD,
+    )
+
+
+templates = metrics.instrument_templates(Jinja2Templates(env=make_environment()))
+# A version of the asset manifest; pages that embed asset URLs include it in their validators.
+STATIC_VERSION = assets.install(templates)
+
+
+def template_names(env: Environment = None) -> list[str]:
+    env = env or templates.env
+    # Built assets and their manifest live under static/ too, but are not templates.
+    return env.list_templates(filter_func=lambda name: name.endswith(assets.TEMPLATE_SUFFIXES))
+
+
+def compile_all(env: Environment = None) -> list[str]:
+    """
+    Load every template, which compiles it into the bytecode cache.
+
+    Returns:
+        list[str]: The names of the templates.
+    """
+    env = env or templates.env
+    names = template_names(env)
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the templates into the bytecode cache.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="the cache directory (default: TEMPLATE_CACHE_DIR)")
+    args = parser.parse_args()
+    names = compile_all(make_environment(cache_dir=args.cache_dir, bytecode_cache=True))
+    print(f"{len(names)} templates compiled")
+
+
+if __name__ == "__main__":
+    main()